@@ -0,0 +1,48 @@
+'''
+Compares resolution through a deep tree of pass-through Routers,
+with and without Router.compile_tree().
+
+Usage (from repository root):
+    PYTHONPATH=src python -m benchmarks.compile_tree
+'''
+import os
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+django.setup()
+
+from django.test import RequestFactory
+from timeit import timeit
+
+from django_subserver import Router, SubRequest
+
+def leaf(request, **kwargs):
+    return kwargs
+
+def make_tree(depth):
+    '''
+    Returns (root router class, path to leaf)
+    '''
+    view = leaf
+    path = ''
+    for level in reversed(range(depth)) :
+        routes = {f'other{i}/': leaf for i in range(5)}
+        routes[f'level{level}/<int:id{level}>/'] = view
+        view = type(f'Level{level}', (Router,), dict(routes=routes))()
+        path = f'level{level}/{level}/' + path
+    return view.__class__, '/' + path
+
+def main(number=5000):
+    request_factory = RequestFactory()
+    print(f'{"depth":>5} {"nested (us)":>12} {"compiled (us)":>14}')
+    for depth in (1, 3, 6, 12) :
+        cls, path = make_tree(depth)
+        request = request_factory.get(path)
+        nested = cls()
+        compiled = cls().compile_tree()
+        assert nested(SubRequest(request)) == compiled(SubRequest(request))
+        nested_time = timeit(lambda: nested(SubRequest(request)), number=number)
+        compiled_time = timeit(lambda: compiled(SubRequest(request)), number=number)
+        print(f'{depth:>5} {nested_time/number*1e6:>12.2f} {compiled_time/number*1e6:>14.2f}')
+
+if __name__ == '__main__':
+    main()
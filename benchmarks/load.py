@@ -0,0 +1,258 @@
+'''
+In-process load harness for sub_view_urls trees.
+
+Drives Django's WSGIHandler (from a pool of threads, all sharing one tree
+of Routers) or ASGIHandler (from concurrent tasks on one event loop)
+directly, without any external server, and reports throughput and
+p50/p95/p99 latency.
+
+Trees are the synthetic ones from benchmarks.routing. Each selected tree
+is mounted (via sub_view_urls) at /<tree name>/, and requests are spread
+evenly over the paths of all selected trees (or over --path, if given).
+
+Usage (from repository root):
+    PYTHONPATH=src python -m benchmarks.load
+    PYTHONPATH=src python -m benchmarks.load --server asgi --concurrency 50
+    PYTHONPATH=src python -m benchmarks.load --tree deep --compiled --route-cache-size 100 --json after.json
+'''
+import os
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+django.setup()
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+from types import ModuleType
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.http import HttpResponse
+from django.urls import include, path
+
+from django_subserver import AsyncRouter, Router, sub_view_urls
+from .routing import TREES, git_revision
+
+def leaf(request, **kwargs):
+    return HttpResponse('ok')
+
+async def async_leaf(request, **kwargs):
+    return HttpResponse('ok')
+
+def build_urlconf(tree_names, server, compiled, route_cache_size):
+    '''
+    Returns (urlconf module, paths).
+    '''
+    if server == 'asgi' :
+        view, base = async_leaf, AsyncRouter
+    else :
+        view, base = leaf, Router
+    if route_cache_size :
+        base = type('CachingRouter', (base,), dict(route_cache_size=route_cache_size))
+
+    urlconf = ModuleType('load_urls')
+    urlconf.urlpatterns = []
+    paths = []
+    for name in tree_names :
+        root, tree_paths = TREES[name](view, base)
+        root = root.compile_tree() if compiled else root.warm()
+        urlconf.urlpatterns.append(path(f'{name}/', include(sub_view_urls(root))))
+        paths += [f'/{name}{tree_path}' for tree_path in tree_paths]
+    return urlconf, paths
+
+def wsgi_environ(path):
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': BytesIO(),
+    }
+
+def run_wsgi(schedules):
+    '''
+    Runs each schedule (a list of paths) in its own thread.
+    Returns (latencies, status counts).
+    '''
+    handler = WSGIHandler()
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(schedule):
+        own_latencies = []
+        own_statuses = {}
+        def start_response(status, headers, exc_info=None):
+            code = status.split(' ', 1)[0]
+            own_statuses[code] = own_statuses.get(code, 0) + 1
+        for path in schedule :
+            started = time.perf_counter()
+            response = handler(wsgi_environ(path), start_response)
+            for chunk in response :
+                pass
+            response.close()
+            own_latencies.append(time.perf_counter() - started)
+        with lock :
+            latencies.extend(own_latencies)
+            for code, count in own_statuses.items() :
+                statuses[code] = statuses.get(code, 0) + count
+
+    with ThreadPoolExecutor(len(schedules)) as executor :
+        for future in [executor.submit(worker, schedule) for schedule in schedules] :
+            future.result()
+    return latencies, statuses
+
+def asgi_scope(path):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [(b'host', b'testserver')],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 1234),
+    }
+
+def run_asgi(schedules):
+    '''
+    Runs each schedule (a list of paths) as its own task.
+    Returns (latencies, status counts).
+    '''
+    handler = ASGIHandler()
+    latencies = []
+    statuses = {}
+
+    async def request(path):
+        received = False
+        async def receive():
+            nonlocal received
+            if not received :
+                received = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Django listens for a disconnect while the view runs
+            await asyncio.Event().wait()
+        async def send(message):
+            if message['type'] == 'http.response.start' :
+                code = str(message['status'])
+                statuses[code] = statuses.get(code, 0) + 1
+        await handler(asgi_scope(path), receive, send)
+
+    async def worker(schedule):
+        for path in schedule :
+            started = time.perf_counter()
+            await request(path)
+            latencies.append(time.perf_counter() - started)
+
+    async def main():
+        await asyncio.gather(*(worker(schedule) for schedule in schedules))
+
+    asyncio.run(main())
+    return latencies, statuses
+
+def run(server='wsgi', concurrency=8, requests=10000, warmup=200, tree_names=None, paths=None, compiled=False, route_cache_size=0, middleware=False, seed=0):
+    tree_names = tree_names or list(TREES)
+    urlconf, tree_paths = build_urlconf(tree_names, server, compiled, route_cache_size)
+    paths = paths or tree_paths
+
+    # Note - must be done before the handler is created (which loads middleware)
+    settings.ROOT_URLCONF = urlconf
+    settings.DEBUG = False
+    if not middleware :
+        settings.MIDDLEWARE = []
+
+    random_ = random.Random(seed)
+    def schedules(total):
+        per_worker = max(1, total // concurrency)
+        return [
+            [random_.choice(paths) for _ in range(per_worker)]
+            for _ in range(concurrency)
+        ]
+
+    runner = run_wsgi if server == 'wsgi' else run_asgi
+    runner(schedules(warmup))
+    started = time.perf_counter()
+    latencies, statuses = runner(schedules(requests))
+    elapsed = time.perf_counter() - started
+
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return dict(
+        meta=dict(
+            revision=git_revision(),
+            timestamp=datetime.now(timezone.utc).isoformat(),
+            python=platform.python_version(),
+            django=django.get_version(),
+        ),
+        config=dict(
+            server=server,
+            concurrency=concurrency,
+            requests=len(latencies),
+            trees=tree_names,
+            paths=paths,
+            compiled=compiled,
+            route_cache_size=route_cache_size,
+            middleware=middleware,
+        ),
+        results=dict(
+            seconds=round(elapsed, 3),
+            requests_per_second=round(len(latencies) / elapsed, 1),
+            p50_ms=round(percentiles[49] * 1000, 3),
+            p95_ms=round(percentiles[94] * 1000, 3),
+            p99_ms=round(percentiles[98] * 1000, 3),
+            max_ms=round(max(latencies) * 1000, 3),
+            statuses=statuses,
+        ),
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--concurrency', type=int, default=8, help='worker threads (wsgi) or tasks (asgi)')
+    parser.add_argument('--requests', type=int, default=10000, help='total number of requests to time')
+    parser.add_argument('--warmup', type=int, default=200, help='requests to make (untimed) before timing')
+    parser.add_argument('--tree', action='append', choices=list(TREES), help='tree(s) to mount (default: all)')
+    parser.add_argument('--path', action='append', help='path(s) to request (default: all paths of the mounted trees)')
+    parser.add_argument('--compiled', action='store_true', help='call compile_tree() on each tree')
+    parser.add_argument('--route-cache-size', type=int, default=0, help='route_cache_size for every Router')
+    parser.add_argument('--middleware', action='store_true', help="keep the MIDDLEWARE from tests.settings")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    data = run(
+        server=args.server,
+        concurrency=args.concurrency,
+        requests=args.requests,
+        warmup=args.warmup,
+        tree_names=args.tree,
+        paths=args.path,
+        compiled=args.compiled,
+        route_cache_size=args.route_cache_size,
+        middleware=args.middleware,
+        seed=args.seed,
+    )
+    print(json.dumps(data['results'], indent=2))
+    if args.json :
+        with open(args.json, 'w') as f :
+            json.dump(data, f, indent=2)
+
+if __name__ == '__main__':
+    main()
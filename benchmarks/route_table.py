@@ -0,0 +1,47 @@
+'''
+Compares RouteTable against a linear scan of Patterns.
+
+Usage (from repository root):
+    PYTHONPATH=src python -m benchmarks.route_table
+'''
+from timeit import timeit
+
+from django_subserver.pattern import Pattern
+from django_subserver.route_table import RouteTable
+
+def make_patterns(count):
+    '''
+    Half fixed routes, half parameterised routes (interleaved).
+    '''
+    patterns = []
+    for i in range(count) :
+        if i % 2 :
+            patterns.append(f'item{i}-<int:id>/')
+        else :
+            patterns.append(f'section{i}/')
+    return [Pattern(p) for p in patterns]
+
+def linear_match(patterns, path):
+    for index, pattern in enumerate(patterns) :
+        try :
+            match, captures = pattern.match(path)
+        except ValueError :
+            continue
+        return index, len(match), captures
+    return None
+
+def main(number=2000):
+    print(f'{"routes":>6} {"path":>16} {"linear (us)":>12} {"table (us)":>12}')
+    for count in (10, 100, 1000) :
+        patterns = make_patterns(count)
+        table = RouteTable(patterns)
+        last_fixed = (count - 1) // 2 * 2
+        last_dynamic = count - 1 if count % 2 == 0 else count - 2
+        for path in (f'section{last_fixed}/x', f'item{last_dynamic}-5/x', 'missing/') :
+            assert linear_match(patterns, path) == table.match(path)
+            linear = timeit(lambda: linear_match(patterns, path), number=number)
+            compiled = timeit(lambda: table.match(path), number=number)
+            print(f'{count:>6} {path[:16]:>16} {linear/number*1e6:>12.2f} {compiled/number*1e6:>12.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+'''
+Routing micro-benchmark suite.
+
+Builds synthetic Router trees (wide, deep, cascade-heavy, mixed converters)
+and measures the cost of resolving requests through them, both by calling
+the tree directly with a SubRequest, and through sub_view_urls (including
+Django's url resolving). Also measures the building blocks on their own
+(Pattern matching, SubRequest.after).
+
+For each case we report the time per call (best of several runs) and the
+peak memory allocated during one call (via tracemalloc).
+
+Usage (from repository root):
+    PYTHONPATH=src python -m benchmarks.routing
+    PYTHONPATH=src python -m benchmarks.routing --json after.json --compare before.json
+'''
+import os
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+django.setup()
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from timeit import Timer
+
+from django.test import RequestFactory
+from django.urls import include, path
+from django.urls.resolvers import RegexPattern, URLResolver
+
+from django_subserver import NOT_FOUND, Router, SubRequest, sub_view_urls
+from django_subserver.pattern import Pattern
+
+def leaf(request, **kwargs):
+    return kwargs
+
+def wide_tree(view=None, base=Router, width=200):
+    '''
+    One Router with many routes (alternating literal and int routes).
+    '''
+    view = view or leaf
+    routes = {}
+    for i in range(width) :
+        if i % 2 :
+            routes[f'item{i}/<int:id>/'] = view
+        else :
+            routes[f'section{i}/'] = view
+    root = type('Wide', (base,), dict(routes=routes))()
+    return root, ['/section0/', f'/item{width-1}/5/', '/missing/']
+
+def deep_tree(view=None, base=Router, depth=8):
+    '''
+    A chain of Routers, each with a few siblings, and an int param per level.
+    '''
+    leaf_view = view or leaf
+    view = leaf_view
+    path = ''
+    for level in reversed(range(depth)) :
+        routes = {f'other{i}/': leaf_view for i in range(4)}
+        routes[f'level{level}/<int:id{level}>/'] = view
+        view = type(f'Level{level}', (base,), dict(routes=routes))()
+        path = f'level{level}/{level}/' + path
+    return view, ['/' + path]
+
+def cascade_tree(view=None, base=Router, length=20):
+    '''
+    A Router cascading to many Routers, only the last of which matches.
+    '''
+    view = view or leaf
+    cascade = []
+    for i in range(length) :
+        cascade.append(type(f'Cascade{i}', (base,), dict(
+            routes={f'only{i}/': view},
+            return_not_found=True,
+        ))())
+    cascade.append(lambda request: NOT_FOUND)
+    root = type('Cascading', (base,), dict(cascade=cascade, path_view=view))()
+    return root, [f'/only{length-1}/', '/nowhere/']
+
+def converter_tree(view=None, base=Router):
+    '''
+    Routes using each of the built-in converters.
+    '''
+    view = view or leaf
+    root = type('Converters', (base,), dict(routes={
+        'int/<int:x>/': view,
+        'str/<str:x>/': view,
+        'slug/<slug:x>/': view,
+        'date/<date:x>/': view,
+        'uuid/<uuid:x>/': view,
+        'path/<path:x>/': view,
+    }))()
+    return root, [
+        '/int/123/',
+        '/str/abc/',
+        '/slug/a-slug/',
+        '/date/2000-01-01/',
+        '/uuid/12345678-1234-5678-1234-567812345678/',
+        '/path/a/b/c/',
+    ]
+
+# name -> function returning (new root Router, paths to request)
+# Each takes the leaf view to use, and the Router (sub)class to build from
+TREES = dict(
+    wide=wide_tree,
+    deep=deep_tree,
+    cascade=cascade_tree,
+    converters=converter_tree,
+)
+
+def resolver_for(root):
+    '''
+    Returns a URLResolver, with root installed via sub_view_urls at '/'.
+    '''
+    return URLResolver(RegexPattern(r'^/'), [
+        path('', include(sub_view_urls(root))),
+    ])
+
+def cases():
+    '''
+    Yields (name, function) pairs.
+    '''
+    request_factory = RequestFactory()
+
+    pattern = Pattern('authors/<int:author_id>/<date:publish_date>/')
+    yield 'pattern.match', lambda: pattern.match('authors/5/2000-01-01/rest')
+
+    sub_request = SubRequest(request_factory.get('/a/b/c/'))
+    sub_request.custom = 1
+    yield 'sub_request.after', lambda: sub_request.after('a/')
+
+    for tree_name, factory in TREES.items() :
+        for compiled in (False, True) :
+            # Note - compile_tree() modifies the whole tree, so we build a fresh one
+            root, paths = factory()
+            root = root.compile_tree() if compiled else root.warm()
+            resolver = resolver_for(root)
+            suffix = '+compiled' if compiled else ''
+            for url in paths :
+                request = request_factory.get(url)
+
+                def direct(root=root, request=request):
+                    try :
+                        return root(SubRequest(request))
+                    except django.http.Http404 :
+                        pass
+                yield f'{tree_name}{suffix} direct {url}', direct
+
+                def via_urls(resolver=resolver, request=request):
+                    match = resolver.resolve(request.path)
+                    try :
+                        return match.func(request, *match.args, **match.kwargs)
+                    except django.http.Http404 :
+                        pass
+                yield f'{tree_name}{suffix} sub_view_urls {url}', via_urls
+
+def measure(function, repeat=5, min_time=0.02):
+    '''
+    Returns the best time per call (in ns), and the median peak of memory
+    allocated (in bytes) while making a single call.
+    '''
+    timer = Timer(function)
+    number = 1
+    while timer.timeit(number) < min_time :
+        number *= 2
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    peaks = []
+    for _ in range(3) :
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        function()
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+    return dict(ns_per_call=round(best * 1e9, 1), peak_bytes=sorted(peaks)[1])
+
+def git_revision():
+    try :
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError) :
+        return None
+
+def run(selected=None):
+    results = []
+    for name, function in cases() :
+        if selected and not any(s in name for s in selected) :
+            continue
+        results.append(dict(name=name, **measure(function)))
+    return dict(
+        meta=dict(
+            revision=git_revision(),
+            timestamp=datetime.now(timezone.utc).isoformat(),
+            python=platform.python_version(),
+            django=django.get_version(),
+        ),
+        results=results,
+    )
+
+def report(data, baseline=None):
+    previous = {}
+    if baseline :
+        previous = {result['name']: result for result in baseline['results']}
+    for result in data['results'] :
+        line = f'{result["name"]:<60} {result["ns_per_call"]:>12.0f} ns {result["peak_bytes"]:>8} B'
+        before = previous.get(result['name'])
+        if before :
+            line += f'   x{result["ns_per_call"]/before["ns_per_call"]:.2f} time'
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='results file (from --json) to compare against')
+    parser.add_argument('--only', action='append', help='only run cases containing this string (may be repeated)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data = run(args.only)
+    baseline = None
+    if args.compare :
+        with open(args.compare) as f :
+            baseline = json.load(f)
+    report(data, baseline)
+    print(f'({time.perf_counter()-started:.1f}s)')
+    if args.json :
+        with open(args.json, 'w') as f :
+            json.dump(data, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Measures the per-level overhead of SubRequest:
+attribute reads (delegated and custom), custom attribute writes,
+and after() (which every Router level calls).
+
+Usage (from repository root):
+    PYTHONPATH=src python -m benchmarks.sub_request
+'''
+import os
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+django.setup()
+
+from django.test import RequestFactory
+from timeit import timeit
+
+from django_subserver import SubRequest
+
+def main(number=200000):
+    request = RequestFactory().get('/a/b/c/d/')
+    request.user = 'user'
+    sub_request = SubRequest(request)
+    sub_request.custom = 1
+    for name in ['one', 'two', 'three'] :
+        setattr(sub_request, name, name)
+
+    def write():
+        sub_request.custom = 2
+
+    cases = [
+        ('SubRequest()', lambda: SubRequest(request)),
+        ('read method', lambda: sub_request.method),
+        ('read GET', lambda: sub_request.GET),
+        ('read custom', lambda: sub_request.custom),
+        ('write custom', write),
+        ('sub_path', lambda: sub_request.sub_path),
+        ('after()', lambda: sub_request.after('a/')),
+    ]
+    print(f'{"operation":>14} {"ns":>8}')
+    for name, function in cases :
+        seconds = timeit(function, number=number)
+        print(f'{name:>14} {seconds/number*1e9:>8.0f}')
+
+if __name__ == '__main__':
+    main()
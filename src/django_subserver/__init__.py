@@ -1,7 +1,10 @@
-from .base import SubRequest
-from .router import Router
+from .base import NOT_FOUND, SubRequest
+from .metrics import RouteMetrics
+from .pattern import register_converter
+from .router import AsyncRouter, Router
 from .urls import sub_view_urls
 
 __all__ = [
-    'SubRequest', 'Router', 'sub_view_urls',
+    'NOT_FOUND', 'SubRequest', 'Router', 'AsyncRouter', 'sub_view_urls',
+    'register_converter', 'RouteMetrics',
 ]
\ No newline at end of file
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+class DjangoSubserverConfig(AppConfig):
+    '''
+    Adding 'django_subserver' to INSTALLED_APPS is optional. 
+    It enables our system checks, and management commands.
+    '''
+    name = 'django_subserver'
+
+    def ready(self):
+        # Registers our checks
+        from . import checks
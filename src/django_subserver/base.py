@@ -1,7 +1,13 @@
+import copy
 from abc import ABC
-from copy import copy
 from django.http import HttpRequest, HttpResponse
 
+try :
+    # Also recognizes views marked with markcoroutinefunction
+    from asgiref.sync import iscoroutinefunction
+except ImportError :
+    from asyncio import iscoroutinefunction
+
 class SubRequest:
     '''
     HttpRequest wrapper, with the ability to keep track of
@@ -18,7 +24,14 @@ class SubRequest:
     data (to ensure that the next SubView you delegate to is not dependent
     on that data). Our interface is considered final. We'll never add any 
     more (public) attributes (without changing major version number).
+
+    Implementation note - this is on the hot path of every request (once per
+    Router level), so we avoid doing work in Python where we can. Reads of 
+    PUBLIC_REQUEST_ATTRIBUTES go through generated descriptors (see 
+    _DelegatedAttribute), rather than __getattr__. Those descriptors are 
+    also what prevents shadowing of HttpRequest attributes.
     '''
+    __slots__ = ('_request', '_parent_path_length', '_sub_path', '__dict__')
 
     # We delegate the getting of these attributes to the underlying HttpRequest
     # Users cannot shadow them on SubRequest instances
@@ -71,13 +84,14 @@ class SubRequest:
 
 
     def __init__(self, request: HttpRequest): 
-        self._request = request
-        self._parent_path_length = 1
+        _set(self, '_request', request)
+        _set(self, '_parent_path_length', 1)
+        _set(self, '_sub_path', None)
+        data = self.__dict__
         for attr in self.COMMON_MIDDLEWARE_ATTRIBUTES :
-            try :
-                setattr(self, attr, getattr(request, attr))
-            except AttributeError :
-                pass
+            value = getattr(request, attr, _missing)
+            if value is not _missing :
+                data[attr] = value
 
     @property
     def request(self) -> HttpRequest:
@@ -105,7 +119,12 @@ class SubRequest:
         Guarantee:
         parent_path + sub_path = request.path
         '''
-        return self._request.path[self._parent_path_length:]
+        # Computed at most once per SubRequest
+        sub_path = self._sub_path
+        if sub_path is None :
+            sub_path = self._request.path[self._parent_path_length:]
+            _set(self, '_sub_path', sub_path)
+        return sub_path
 
     def after(self, path_portion: str):
         '''
@@ -113,11 +132,37 @@ class SubRequest:
         '''
         if not path_portion.endswith('/') :
             raise ValueError('path_portion must end with "/"')
-        if not self.sub_path.startswith(path_portion) :
+        if not self._request.path.startswith(path_portion, self._parent_path_length) :
             raise ValueError('path_portion is not a prefix of sub_path')
+        return self._advance(self._parent_path_length + len(path_portion))
+
+    def _advance(self, parent_path_length):
+        '''
+        Like after(), but takes the new parent path length, and doesn't
+        validate it. Used by Router (which knows it's valid).
+        '''
+        # Equivalent to copy(self), but much cheaper
+        next_request = _new(self.__class__)
+        _set(next_request, '_request', self._request)
+        _set(next_request, '_parent_path_length', parent_path_length)
+        _set(next_request, '_sub_path', None)
+        _set(next_request, '__dict__', self.__dict__.copy())
+        return next_request
+
+    def __copy__(self):
+        # The default implementation restores slots via setattr(), which
+        # we don't allow for _sub_path
+        return self._advance(self._parent_path_length)
 
-        next_request = copy(self)
-        next_request._parent_path_length += len(path_portion)
+    def __deepcopy__(self, memo):
+        # As above. Copies the underlying HttpRequest, too (like the default
+        # implementation did, before we had __slots__)
+        next_request = _new(self.__class__)
+        memo[id(self)] = next_request
+        _set(next_request, '_request', copy.deepcopy(self._request, memo))
+        _set(next_request, '_parent_path_length', self._parent_path_length)
+        _set(next_request, '_sub_path', None)
+        _set(next_request, '__dict__', copy.deepcopy(self.__dict__, memo))
         return next_request
 
     def clear_data_except(self, *exceptions, common_middleware=False):
@@ -151,25 +196,79 @@ class SubRequest:
         We also ensure that attributes don't start with '_', because those 
         are reservered for use internally by the class.
         '''
-        def message(attr, reason):
-            return f'Illegal attribute: "{attr}"; {reason}'
+        if attr in _RESERVED_ATTRIBUTES or attr[:1] == '_' :
+            if attr in _INTERNAL_ATTRIBUTES :
+                _set(self, attr, value)
+                _set(self, '_sub_path', None)
+                return
 
-        if attr.startswith('_') :
-            if attr not in ('_request', '_parent_path_length') :
-                raise AttributeError(message(attr, 'private attributes (starting with "_") are reserved for internal use by SubRequest. If you are using 3rd party apps that get/set "private" attributes on the request object, be sure to pass them the value of SubRequest.request, rather than a SubRequest directly.'))
+            def message(attr, reason):
+                return f'Illegal attribute: "{attr}"; {reason}'
 
-        if hasattr(SubRequest, attr):
+            if attr in _PUBLIC_REQUEST_ATTRIBUTES :
+                raise AttributeError(message(attr, 'cannot shadow HTTPRequest attributes'))
+            if attr.startswith('_') :
+                raise AttributeError(message(attr, 'private attributes (starting with "_") are reserved for internal use by SubRequest. If you are using 3rd party apps that get/set "private" attributes on the request object, be sure to pass them the value of SubRequest.request, rather than a SubRequest directly.'))
             raise AttributeError(message(attr, 'cannot shadow SubRequest attributes.'))
-        
-        if attr in self.PUBLIC_REQUEST_ATTRIBUTES:
-            raise AttributeError(message(attr, 'cannot shadow HTTPRequest attributes'))
-        
-        super().__setattr__(attr, value)
+
+        _set(self, attr, value)
     def __getattr__(self, attr):
-        if attr in self.PUBLIC_REQUEST_ATTRIBUTES :
+        # Note - only called if normal lookup fails
+        if attr in _PUBLIC_REQUEST_ATTRIBUTES :
             return getattr(self._request, attr)
         raise AttributeError(f'{self} has no "{attr}" attribute. Did you mean to read from SubRequest.request, instead?')
 
+class _DelegatedAttribute:
+    '''
+    Descriptor which reads an attribute from SubRequest.request.
+    It's a data descriptor (defines __set__), so instances can't shadow it.
+    '''
+    __slots__ = ('name',)
+    def __init__(self, name):
+        self.name = name
+    def __get__(self, instance, owner=None):
+        if instance is None :
+            return self
+        return getattr(instance._request, self.name)
+    def __set__(self, instance, value):
+        raise AttributeError(f'Illegal attribute: "{self.name}"; cannot shadow HTTPRequest attributes')
+
+for _name in SubRequest.PUBLIC_REQUEST_ATTRIBUTES :
+    setattr(SubRequest, _name, _DelegatedAttribute(_name))
+del _name
+
+_set = object.__setattr__
+_missing = object()
+_new = object.__new__
+_PUBLIC_REQUEST_ATTRIBUTES = frozenset(SubRequest.PUBLIC_REQUEST_ATTRIBUTES)
+_INTERNAL_ATTRIBUTES = frozenset(['_request', '_parent_path_length'])
+# Anything that would shadow a SubRequest (or HttpRequest) attribute
+_RESERVED_ATTRIBUTES = frozenset(dir(SubRequest))
+
+class _NotFound:
+    '''
+    A SubView may return NOT_FOUND instead of raising Http404.
+
+    Router treats the two the same way (ie. when trying cascade views),
+    and sub_view_urls turns NOT_FOUND into Http404. Returning NOT_FOUND
+    is cheaper than raising, since no exception has to be built and
+    unwound (which adds up with deep cascades). Test for it with "is".
+    '''
+    def __repr__(self):
+        return 'NOT_FOUND'
+    def __reduce__(self):
+        return 'NOT_FOUND'
+
+NOT_FOUND = _NotFound()
+
+def is_async_view(view) -> bool :
+    '''
+    Returns True if calling view returns an awaitable.
+    That is, view is a coroutine function, or an object (ie. an
+    AsyncRouter) whose __call__ is a coroutine function.
+    '''
+    return iscoroutinefunction(view) or iscoroutinefunction(getattr(view, '__call__', None))
+
 class SubView(ABC):
     '''
     This is just a description of what a "sub view" is.
@@ -181,6 +280,11 @@ class SubView(ABC):
     A "sub view" is similar. It takes:
     - a SubRequest
     - parameters captured by the parent Router only
+
+    Instead of raising Http404, a sub view may return NOT_FOUND.
+
+    A sub view may also be async (ie. a coroutine function, or an 
+    AsyncRouter), in which case it returns an awaitable.
     '''
     def __call__(self, request: SubRequest, **captured_params) -> HttpResponse :
         pass
\ No newline at end of file
@@ -0,0 +1,219 @@
+'''
+A batch endpoint, which handles several GET requests (to a Router tree)
+in one HTTP request.
+
+Mount it beside the tree it serves:
+
+    API = ApiRouter()
+    urlpatterns = [
+        path('api/', include(sub_view_urls(API))),
+        path('api-batch/', include(sub_view_urls(batch_view(API, mount_path='/api/')))),
+    ]
+
+Clients POST a JSON list of requests:
+
+    [{"path": "/api/users/1/"}, {"method": "HEAD", "path": "news/?page=2"}]
+
+(path may be absolute, or relative to mount_path), and get back a JSON
+list of responses, in the same order:
+
+    [{"status": 200, "headers": {...}, "body": ...}, ...]
+
+where body is the decoded JSON for JSON responses (that are valid JSON),
+and text otherwise.
+
+Each item is resolved via Router.call_internal(), so middleware only runs
+once (for the batch request), and every item shares its user and session.
+Items are handled concurrently.
+'''
+
+import asyncio
+import contextvars
+import json
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from django import db, http
+from django.core.handlers.exception import response_for_exception
+from django.utils import translation
+from threading import Lock
+from typing import Iterable
+
+from .base import SubView, is_async_view
+from .internal import needs_render
+from .router import Router
+
+class BatchView(SubView):
+    '''
+    Handles a batch of requests to router (see module docstring).
+
+    mount_path:
+        the path router is mounted at
+    max_items:
+        maximum number of requests in a batch (larger batches get a 400)
+    max_workers:
+        maximum number of items handled at once. If 1, items are handled
+        serially, in the calling thread.
+    methods:
+        methods items may use. Items never have a request body, so only
+        safe methods make sense.
+
+    Exceptions raised while handling an item are converted to that item's
+    response the same way Django would (404, 403, 400, 500, etc.). Cookies
+    set by item responses are discarded.
+
+    Note - the batch request itself is a POST, so it is subject to
+    CsrfViewMiddleware (if installed), like any other POST.
+    '''
+    def __init__(self, router: Router, mount_path: str = '/', max_items: int = 20, max_workers: int = 4, methods: Iterable[str] = ('GET', 'HEAD')):
+        if not (mount_path.startswith('/') and mount_path.endswith('/')) :
+            raise ValueError('mount_path must start and end with "/"')
+        self.router = router
+        self.mount_path = mount_path
+        self.max_items = max_items
+        self.max_workers = max_workers
+        self.methods = frozenset(method.upper() for method in methods)
+        self._executor = None
+        self._executor_lock = Lock()
+
+    def _parse(self, request):
+        '''
+        Returns [(method, path)], or an error response.
+        '''
+        if request.method != 'POST' :
+            return http.HttpResponseNotAllowed(['POST'])
+        try :
+            items = json.loads(request.body)
+        except ValueError :
+            return http.HttpResponseBadRequest('Request body must be JSON')
+        if not isinstance(items, list) :
+            return http.HttpResponseBadRequest('Request body must be a JSON list')
+        if len(items) > self.max_items :
+            return http.HttpResponseBadRequest(f'At most {self.max_items} requests allowed')
+
+        parsed = []
+        for item in items :
+            if not isinstance(item, dict) or not isinstance(item.get('path'), str) :
+                return http.HttpResponseBadRequest('Each request must be an object with a "path"')
+            method = item.get('method', 'GET')
+            if not isinstance(method, str) or method.upper() not in self.methods :
+                return http.HttpResponseBadRequest(f'Each request method must be one of {", ".join(sorted(self.methods))}')
+            parsed.append((method.upper(), item['path']))
+        return parsed
+
+    def _relative(self, path):
+        '''
+        Returns path relative to mount_path, or None if it's not below it.
+        '''
+        if not path.startswith('/') :
+            return path
+        if path.startswith(self.mount_path) :
+            return path[len(self.mount_path):]
+        return None
+
+    def _result(self, method, response):
+        if needs_render(response) :
+            response = response.render()
+        if response.streaming :
+            content = b''.join(response.streaming_content)
+        else :
+            content = response.content
+        response.close()
+        body = None
+        if method == 'HEAD' :
+            body = ''
+        elif response.get('Content-Type', '').startswith('application/json') :
+            try :
+                body = json.loads(content)
+            except ValueError :
+                # Returned as text, below
+                pass
+        if body is None :
+            body = content.decode(response.charset, errors='replace')
+        return dict(
+            status=response.status_code,
+            headers=dict(response.items()),
+            body=body,
+        )
+
+    def _call(self, request, method, path):
+        relative = self._relative(path)
+        try :
+            if relative is None :
+                raise http.Http404()
+            response = self.router.call_internal(request, relative, method, mount_path=self.mount_path)
+            return self._result(method, response)
+        except Exception as e :
+            return self._result(method, response_for_exception(request.request, e))
+
+    def _call_in_thread(self, language, request, method, path):
+        try :
+            with translation.override(language) :
+                return self._call(request, method, path)
+        finally :
+            # Nothing else will close connections opened in this thread
+            db.close_old_connections()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor :
+        with self._executor_lock :
+            if self._executor is None :
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='subserver-batch')
+            return self._executor
+
+    def __call__(self, request, **captured_params):
+        # captured_params (from routes/urlconf prefixes above us) are unused
+        items = self._parse(request)
+        if isinstance(items, http.HttpResponse) :
+            return items
+        if self.max_workers <= 1 or len(items) <= 1 :
+            results = [self._call(request, method, path) for method, path in items]
+        else :
+            language = translation.get_language()
+            executor = self.executor
+            futures = [
+                # Each item gets its own copy of our context (ContextVars)
+                executor.submit(contextvars.copy_context().run, self._call_in_thread, language, request, method, path)
+                for method, path in items
+            ]
+            results = [future.result() for future in futures]
+        return http.JsonResponse(results, safe=False)
+
+class AsyncBatchView(BatchView):
+    '''
+    BatchView for AsyncRouters. Items are handled concurrently on the event
+    loop (via asyncio.gather), at most max_workers at a time.
+    '''
+    async def _call(self, request, method, path, semaphore):
+        relative = self._relative(path)
+        async with semaphore :
+            try :
+                if relative is None :
+                    raise http.Http404()
+                response = await self.router.call_internal(request, relative, method, mount_path=self.mount_path)
+                if getattr(response, 'is_async', False) :
+                    content = b''.join([chunk async for chunk in response.streaming_content])
+                    response = http.HttpResponse(content, status=response.status_code, content_type=response.get('Content-Type'))
+                return self._result(method, response)
+            except Exception as e :
+                response = await sync_to_async(response_for_exception)(request.request, e)
+        return self._result(method, response)
+
+    async def __call__(self, request, **captured_params):
+        items = self._parse(request)
+        if isinstance(items, http.HttpResponse) :
+            return items
+        semaphore = asyncio.Semaphore(max(self.max_workers, 1))
+        results = await asyncio.gather(*(
+            self._call(request, method, path, semaphore)
+            for method, path in items
+        ))
+        return http.JsonResponse(results, safe=False)
+
+def batch_view(router: Router, **options) -> BatchView :
+    '''
+    Returns a BatchView (or AsyncBatchView, if router is async)
+    for router. See BatchView for options.
+    '''
+    if is_async_view(router) :
+        return AsyncBatchView(router, **options)
+    return BatchView(router, **options)
@@ -0,0 +1,275 @@
+'''
+Per-subtree concurrency limits, with fast load shedding.
+
+Wrap any (slow) SubView where it's installed:
+
+    EXPORTS = bulkhead(ExportsRouter(), limit=4, queue_size=8, name='exports')
+
+    class RootRouter(Router):
+        routes = {
+            'exports/': EXPORTS,
+        }
+
+At most limit requests are handled by the subtree at once. Up to
+queue_size more may wait (for at most queue_timeout seconds) for a slot.
+Any others get an immediate 503 (with Retry-After), so a slow subtree
+can't tie up every worker, and starve the rest of the site.
+
+EXPORTS.status() (or status(), at module level, for every bulkhead)
+reports live in-flight and waiting counts.
+'''
+
+import asyncio
+from collections import deque
+from django import http
+from threading import Condition, Lock
+from typing import Optional
+from weakref import WeakSet
+
+from .base import SubView, is_async_view
+
+# Every bulkhead created (for status())
+_bulkheads = WeakSet()
+_bulkheads_lock = Lock()
+
+def status() -> dict :
+    '''
+    Returns name -> BulkheadView.status() for every live bulkhead.
+    '''
+    with _bulkheads_lock :
+        bulkheads = list(_bulkheads)
+    return {view.name: view.status() for view in bulkheads}
+
+class BulkheadView(SubView):
+    '''
+    Calls view, with at most limit requests in flight at once.
+
+    queue_size:
+        maximum number of requests waiting for a slot (0 for none)
+    queue_timeout:
+        maximum seconds a request waits for a slot
+    retry_after:
+        value of the Retry-After header (seconds) of 503 responses
+    name:
+        name to report status() under (defaults to repr(view))
+
+    Shed requests get a plain 503 response, built from preencoded content,
+    without calling view. Waiting requests aren't strictly first come,
+    first served.
+
+    If view returns a streaming response, its slot is held until the
+    response is closed (which Django does once it has been sent), rather
+    than released when view returns.
+    '''
+    def __init__(self, view: SubView, limit: int, queue_size: int = 0, queue_timeout: float = 0.1, retry_after: int = 1, name: Optional[str] = None):
+        if limit < 1 :
+            raise ValueError('limit must be at least 1')
+        if queue_size < 0 :
+            raise ValueError('queue_size must not be negative')
+        self.view = view
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.name = name or repr(view)
+        self._content = b'Service temporarily unavailable (overloaded). Please retry.\n'
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self._condition = Condition()
+        with _bulkheads_lock :
+            _bulkheads.add(self)
+
+    def status(self) -> dict :
+        '''
+        Returns a snapshot of our counts.
+        admitted and shed are totals (since creation).
+        '''
+        return dict(
+            limit=self.limit,
+            in_flight=self.in_flight,
+            queue_size=self.queue_size,
+            waiting=self.waiting,
+            admitted=self.admitted,
+            shed=self.shed,
+        )
+
+    def shed_response(self) -> http.HttpResponse :
+        '''
+        Returns the response for shed requests.
+        May be overridden (but should stay cheap).
+        '''
+        response = http.HttpResponse(self._content, status=503, content_type='text/plain')
+        response['Retry-After'] = str(self.retry_after)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def _acquire(self) -> bool :
+        with self._condition :
+            if self.in_flight >= self.limit :
+                if self.waiting >= self.queue_size :
+                    self.shed += 1
+                    return False
+                self.waiting += 1
+                try :
+                    available = self._condition.wait_for(lambda: self.in_flight < self.limit, self.queue_timeout)
+                finally :
+                    self.waiting -= 1
+                if not available :
+                    self.shed += 1
+                    return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def _release(self):
+        with self._condition :
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def _hold(self, response, release) -> bool :
+        '''
+        If response is streaming, arranges for release to be called when
+        it's closed, and returns True.
+        '''
+        if not getattr(response, 'streaming', False) :
+            return False
+        response._resource_closers.append(_Once(release))
+        return True
+
+    def __call__(self, request, **kwargs):
+        if not self._acquire() :
+            return self.shed_response()
+        held = False
+        try :
+            response = self.view(request, **kwargs)
+            held = self._hold(response, self._release)
+            return response
+        finally :
+            if not held :
+                self._release()
+
+class _Once:
+    '''
+    Calls function at most once.
+    '''
+    __slots__ = ('function',)
+    def __init__(self, function):
+        self.function = function
+    def __call__(self):
+        function, self.function = self.function, None
+        if function is not None :
+            function()
+
+class _Waiter:
+    '''
+    A request (on loop) waiting for a slot.
+    granted is set (under the lock) when a slot is handed to it.
+    '''
+    __slots__ = ('loop', 'future', 'granted')
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+def _wake(future):
+    if not future.done() :
+        future.set_result(None)
+
+class AsyncBulkheadView(BulkheadView):
+    '''
+    BulkheadView for async views. Waiting requests are handed a slot
+    directly, in arrival order.
+
+    The limit applies across every event loop in the process (ie. when
+    called via async_to_sync, from several threads). Counts are guarded by
+    a (briefly held) threading lock, and waiting requests are woken on
+    their own loop, via call_soon_threadsafe().
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = Lock()
+        self._waiters = deque()
+
+    async def _acquire_async(self) -> bool :
+        with self._lock :
+            if self.in_flight < self.limit and not self._waiters :
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if len(self._waiters) >= self.queue_size :
+                self.shed += 1
+                return False
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+            self.waiting += 1
+
+        try :
+            # Note - unlike wait_for(), wait() doesn't cancel the future
+            await asyncio.wait((waiter.future,), timeout=self.queue_timeout)
+        except asyncio.CancelledError :
+            if self._abandon(waiter) :
+                # We were handed a slot, but won't use it
+                self._release_async()
+            raise
+        if self._abandon(waiter) :
+            with self._lock :
+                self.admitted += 1
+            return True
+        with self._lock :
+            self.shed += 1
+        return False
+
+    def _abandon(self, waiter) -> bool :
+        '''
+        Stops waiter waiting. Returns True if it was granted a slot.
+        '''
+        with self._lock :
+            if waiter.granted :
+                return True
+            self._waiters.remove(waiter)
+            self.waiting -= 1
+            return False
+
+    def _release_async(self):
+        '''
+        Releases a slot. May be called from any thread.
+        '''
+        while True :
+            with self._lock :
+                if not self._waiters :
+                    self.in_flight -= 1
+                    return
+                # Hand our slot over, without changing in_flight
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self.waiting -= 1
+            try :
+                waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+                return
+            except RuntimeError :
+                # Its loop is closed - try the next waiter
+                continue
+
+    async def __call__(self, request, **kwargs):
+        if not await self._acquire_async() :
+            return self.shed_response()
+        held = False
+        try :
+            response = await self.view(request, **kwargs)
+            # Note - Django's ASGIHandler closes responses in a thread
+            held = self._hold(response, self._release_async)
+            return response
+        finally :
+            if not held :
+                self._release_async()
+
+def bulkhead(view: SubView, limit: int, **options) -> BulkheadView :
+    '''
+    Returns a BulkheadView (or AsyncBulkheadView, if view is async)
+    wrapping view. See BulkheadView for options.
+    '''
+    if is_async_view(view) :
+        return AsyncBulkheadView(view, limit, **options)
+    return BulkheadView(view, limit, **options)
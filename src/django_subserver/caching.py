@@ -0,0 +1,304 @@
+'''
+Caching of full responses from a subtree, via Django's cache framework.
+
+Wrap any SubView (usually a Router) where it's installed:
+
+    class ApiRouter(Router):
+        routes = {
+            'docs/': cached(DocsRouter(), timeout=600, query_params=['page']),
+        }
+
+Cache hits skip everything below the wrapper (prepare(), route matching,
+views). Only GET requests are cached. By default, only anonymous requests
+(without a session cookie, or an authenticated user) use the cache, and
+responses which used the session or the CSRF token are never cached
+(see CachedView).
+'''
+
+from asgiref.sync import sync_to_async
+from django import http
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import cc_delim_re
+from hashlib import sha256
+from typing import Callable, Iterable, Optional
+from uuid import uuid4
+
+from .base import SubView, is_async_view
+
+def _hash(*parts):
+    return sha256(repr(parts).encode()).hexdigest()[:32]
+
+def _generation_key(key_prefix, path_prefix):
+    return f'{key_prefix}:generation:{_hash(path_prefix)}'
+
+def _path_prefixes(path):
+    '''
+    '/a/b/c' -> ['/', '/a/', '/a/b/']
+    '''
+    return [path[:index+1] for index, char in enumerate(path) if char == '/']
+
+def invalidate(path_prefix: str, cache: str = 'default', key_prefix: str = 'subserver'):
+    '''
+    Invalidates every cached response (stored with the same cache and
+    key_prefix) whose path starts with path_prefix (which must end with "/").
+
+    Each path prefix has a "generation" (stored in the cache, with no
+    timeout), which is part of the cache key of every response below it.
+    Invalidating assigns a new generation, so old entries are never read
+    again (and expire normally).
+    '''
+    if not path_prefix.endswith('/') :
+        raise ValueError('path_prefix must end with "/"')
+    caches[cache].set(_generation_key(key_prefix, path_prefix), uuid4().hex, None)
+
+def is_anonymous(request) -> bool :
+    '''
+    True if request has no session cookie, and no authenticated user.
+    The default condition of CachedView.
+
+    Checking the user doesn't count as accessing the session (which would
+    stop the response being cached, and add "Vary: Cookie").
+    '''
+    if settings.SESSION_COOKIE_NAME in request.COOKIES :
+        return False
+    user = getattr(request, 'user', None)
+    if user is None :
+        return True
+    session = getattr(request, 'session', None)
+    accessed = getattr(session, 'accessed', None)
+    try :
+        return not user.is_authenticated
+    finally :
+        if accessed is not None :
+            session.accessed = accessed
+
+class CachedView(SubView):
+    '''
+    Calls view, caching its responses to GET requests.
+
+    timeout:
+        seconds to cache responses for (None for forever)
+    cache:
+        alias of the Django cache to use
+    key_prefix:
+        prefix of all our cache keys (and invalidation generations)
+    headers:
+        names of request headers which are part of the cache key
+        (ie. ['Accept-Language'])
+    query_params:
+        names of query params which are part of the cache key. If None,
+        the whole query string is. (The scheme, host and path always are.)
+    condition:
+        optional function (request) -> bool. If it returns False, the
+        request bypasses the cache. Defaults to is_anonymous() (so only
+        requests without a session cookie or authenticated user use it).
+        Only override this if your responses never depend on the user.
+    statuses:
+        response status codes to cache
+    max_streaming_size:
+        streaming responses are never cached if 0 (default). Otherwise,
+        they're buffered and cached if their content is no larger than this
+        (in bytes), and streamed on otherwise.
+
+    Responses are not cached if they set cookies, have a Cache-Control
+    header with private/no-cache/no-store, or a Vary header naming request
+    headers that aren't part of our key. Nor are they cached if the session
+    was accessed, or the CSRF token used, while handling the request. Those
+    make SessionMiddleware/CsrfViewMiddleware add cookies and "Vary: Cookie"
+    after we've returned, so we can't see them on the response.
+
+    Unrendered TemplateResponses are cached once rendered (like Django's
+    UpdateCacheMiddleware does).
+
+    Note - if the session was already accessed before we were called (ie. by
+    middleware), nothing is cached.
+    '''
+    def __init__(
+        self,
+        view: SubView,
+        timeout: Optional[float] = 300,
+        cache: str = 'default',
+        key_prefix: str = 'subserver',
+        headers: Iterable[str] = (),
+        query_params: Optional[Iterable[str]] = None,
+        condition: Optional[Callable] = None,
+        statuses: Iterable[int] = (200,),
+        max_streaming_size: int = 0,
+    ):
+        self.view = view
+        self.timeout = timeout
+        self.cache_alias = cache
+        self.key_prefix = key_prefix
+        self.headers = list(headers)
+        self._vary_ok = {header.lower() for header in self.headers}
+        self.query_params = query_params if query_params is None else list(query_params)
+        self.condition = condition
+        self.statuses = frozenset(statuses)
+        self.max_streaming_size = max_streaming_size
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def invalidate(self, path_prefix: str):
+        '''
+        See invalidate() (at module level).
+        '''
+        invalidate(path_prefix, self.cache_alias, self.key_prefix)
+
+    def _cacheable_request(self, request):
+        if request.method != 'GET' :
+            return False
+        if self.condition is None :
+            return is_anonymous(request)
+        return self.condition(request)
+
+    def _shareable(self, request):
+        '''
+        False if handling request used per-user state, which middleware
+        will add cookies/Vary headers for (after we've seen the response).
+        '''
+        if getattr(getattr(request, 'session', None), 'accessed', False) :
+            return False
+        # Set by django.middleware.csrf.get_token()
+        if request.META.get('CSRF_COOKIE_NEEDS_UPDATE') :
+            return False
+        return True
+
+    def _key(self, request):
+        path = request.path
+        if self.query_params is None :
+            query = sorted(request.GET.lists())
+        else :
+            query = [(name, request.GET.getlist(name)) for name in self.query_params]
+        headers = [request.headers.get(name, '') for name in self.headers]
+
+        cache = self.cache
+        prefixes = [_generation_key(self.key_prefix, prefix) for prefix in _path_prefixes(path)]
+        generations = cache.get_many(prefixes)
+        return f'{self.key_prefix}:response:' + _hash(
+            # As in django.utils.cache._generate_cache_key()
+            request.scheme,
+            request.get_host(),
+            path,
+            repr(query),
+            repr(headers),
+            repr([generations.get(key, '') for key in prefixes]),
+        )
+
+    def _lookup(self, request):
+        '''
+        Returns (key, cached response or None), or None if request
+        bypasses the cache.
+        '''
+        if not self._cacheable_request(request) :
+            return None
+        key = self._key(request)
+        return key, self.cache.get(key)
+
+    def _cacheable_response(self, response):
+        if not isinstance(response, http.HttpResponseBase) :
+            return False
+        if response.status_code not in self.statuses or response.cookies :
+            return False
+        cache_control = response.get('Cache-Control', '').lower()
+        if any(directive in cache_control for directive in ('private', 'no-cache', 'no-store')) :
+            return False
+        if response.has_header('Vary') :
+            vary = {header.strip().lower() for header in cc_delim_re.split(response['Vary'])}
+            if not vary <= self._vary_ok :
+                return False
+        return True
+
+    def _buffer(self, response):
+        '''
+        Returns (response to return, response to cache or None).
+        '''
+        if not response.streaming :
+            return response, response
+        if not self.max_streaming_size or getattr(response, 'is_async', False) :
+            return response, None
+
+        chunks = []
+        size = 0
+        iterator = iter(response.streaming_content)
+        for chunk in iterator :
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.max_streaming_size :
+                # Too big - stream on (starting with what we've already read)
+                def rest():
+                    yield from chunks
+                    yield from iterator
+                response.streaming_content = rest()
+                return response, None
+
+        buffered = http.HttpResponse(b''.join(chunks), status=response.status_code)
+        for header, value in response.items() :
+            if header.lower() != 'content-length' :
+                buffered[header] = value
+        response.close()
+        return buffered, buffered
+
+    def _store(self, request, key, response):
+        '''
+        Returns the response to return.
+        '''
+        if not (self._shareable(request) and self._cacheable_response(response)) :
+            return response
+        if hasattr(response, 'add_post_render_callback') and not response.is_rendered :
+            # ie. TemplateResponse - can't be pickled until rendered (which
+            # may also use the session or CSRF token)
+            def store(rendered):
+                if self._shareable(request) :
+                    self.cache.set(key, rendered, self.timeout)
+            response.add_post_render_callback(store)
+            return response
+        response, to_cache = self._buffer(response)
+        if to_cache is not None :
+            self.cache.set(key, to_cache, self.timeout)
+        return response
+
+    def __call__(self, request, **kwargs):
+        found = self._lookup(request) if request.method == 'GET' else None
+        if found is None :
+            return self.view(request, **kwargs)
+        key, response = found
+        if response is not None :
+            self.hits += 1
+            return response
+        self.misses += 1
+        return self._store(request, key, self.view(request, **kwargs))
+
+class AsyncCachedView(CachedView):
+    '''
+    CachedView for async views. Cache access (and checking the user) runs
+    in a thread (via sync_to_async), like Django's own async cache methods.
+
+    Note - streaming responses with async iterators are never cached.
+    '''
+    async def __call__(self, request, **kwargs):
+        found = await sync_to_async(self._lookup)(request) if request.method == 'GET' else None
+        if found is None :
+            return await self.view(request, **kwargs)
+        key, response = found
+        if response is not None :
+            self.hits += 1
+            return response
+        self.misses += 1
+        response = await self.view(request, **kwargs)
+        if getattr(response, 'is_async', False) :
+            return response
+        return await sync_to_async(self._store)(request, key, response)
+
+def cached(view: SubView, **options) -> CachedView :
+    '''
+    Returns a CachedView (or AsyncCachedView, if view is async)
+    wrapping view. See CachedView for options.
+    '''
+    if is_async_view(view) :
+        return AsyncCachedView(view, **options)
+    return CachedView(view, **options)
@@ -0,0 +1,220 @@
+'''
+Django system checks for Router trees mounted via sub_view_urls.
+
+Registered when 'django_subserver' is in INSTALLED_APPS (see apps.py), so
+they run with `manage.py check` (and runserver, migrate, etc.).
+
+You can also call check_router() directly (ie. from a test).
+'''
+
+import re
+from django.conf import settings
+from django.core import checks
+
+from .pattern import Pattern
+from .router import AsyncRouter, Router, _resolve
+
+# Maximum number of cascade views a single request may try
+# (counting nested cascades), before we warn
+DEFAULT_MAX_CASCADE = 10
+
+# A quantified group, which is itself quantified, ie. "(?:a+)+"
+_nested_quantifier = re.compile(r'\((?:[^()\\]|\\.)*[+*}]\)[+*{]')
+
+@checks.register(checks.Tags.urls)
+def check_sub_view_urls(app_configs=None, **kwargs):
+    '''
+    Checks every Router tree installed (via sub_view_urls) in the root urlconf.
+    '''
+    from django.urls import get_resolver
+    messages = []
+    seen = set()
+    for callback in _callbacks(get_resolver().url_patterns) :
+        sub_view = getattr(callback, 'sub_view', None)
+        if sub_view is not None :
+            messages += check_router(sub_view, seen)
+    return messages
+
+def _callbacks(url_patterns):
+    for url_pattern in url_patterns :
+        if hasattr(url_pattern, 'url_patterns') :
+            yield from _callbacks(url_pattern.url_patterns)
+        else :
+            yield url_pattern.callback
+
+def check_router(view, seen=None) -> list :
+    '''
+    Returns a list of check messages for view, and every Router below it.
+    '''
+    if seen is None :
+        seen = set()
+    messages = []
+    for router in _routers(view, seen) :
+        messages += _check_routes(router)
+        messages += _check_cascade(router)
+        messages += _check_patterns(router)
+    return messages
+
+def _children(view):
+    '''
+    The views which view may delegate to.
+    '''
+    if isinstance(view, Router) :
+        cls = view.__class__
+        for pattern, child in view.routes :
+            yield _resolve(child)
+        for child in view.cascade_to :
+            yield _resolve(child)
+        if cls.root_view :
+            yield cls.root_view
+        if cls.path_view :
+            yield cls.path_view
+    # ie. profiling.ProfiledView
+    wrapped = getattr(view, 'view', None)
+    if wrapped is not None and callable(wrapped) :
+        yield wrapped
+
+def _routers(view, seen):
+    if id(view) in seen :
+        return
+    seen.add(id(view))
+    if isinstance(view, Router) :
+        yield view
+    for child in _children(view) :
+        yield from _routers(child, seen)
+
+def _warning(message, router, id, hint=None):
+    return checks.Warning(message, hint=hint, obj=router._router_name(), id=f'django_subserver.{id}')
+
+def _segments(pattern):
+    segments = []
+    while pattern is not None :
+        head, pattern = pattern.split_first_segment()
+        segments.append(head)
+    return segments
+
+def _single_param(segment):
+    '''
+    Returns the param, if segment is just "<type:name>/"
+    '''
+    if len(segment._parts) == 3 and segment._parts[0] == '' and segment._parts[2] == '/' :
+        return segment._params[0]
+    return None
+
+def _never_fails(param):
+    return param.converter is str
+
+def _covers(earlier, later) -> bool :
+    '''
+    True if earlier (a single segment Pattern) matches every path segment
+    that later does.
+    '''
+    if earlier.regex('') == later.regex('') and [param.converter for param in earlier._params] == [param.converter for param in later._params] :
+        return True
+    param = _single_param(earlier)
+    if param is None or param.multi_segment :
+        return False
+    if later.multi_segment :
+        return False
+    if param.regex == r'[^/]+' and _never_fails(param) :
+        return True
+    if later.literal and re.fullmatch(param.regex, later.pattern[:-1]) :
+        try :
+            param.converter(later.pattern[:-1])
+        except ValueError :
+            return False
+        return True
+    return False
+
+def shadows(earlier: Pattern, later: Pattern) -> bool :
+    '''
+    True if earlier matches (a prefix of) every sub_path that later matches,
+    so that a route using later can never be reached.
+
+    Conservative: may return False for some Patterns which do shadow.
+    '''
+    earlier_segments = _segments(earlier)
+    later_segments = _segments(later)
+    for index, segment in enumerate(earlier_segments) :
+        if index >= len(later_segments) :
+            return False
+        param = _single_param(segment)
+        if (
+            param and param.multi_segment and param.regex == '.+' and _never_fails(param)
+            and index == len(earlier_segments) - 1
+        ) :
+            # "<path:p>/" at the end matches everything from here on
+            return True
+        if not _covers(segment, later_segments[index]) :
+            return False
+    return True
+
+def _check_routes(router):
+    messages = []
+    patterns = [pattern for pattern, view in router.routes]
+    for index, later in enumerate(patterns) :
+        for earlier in patterns[:index] :
+            if shadows(earlier, later) :
+                messages.append(_warning(
+                    f'Route "{later.pattern}" is unreachable; "{earlier.pattern}" is declared earlier, and matches everything it would.',
+                    router, 'W001',
+                    hint='Routes are tried in order, and match a prefix of sub_path. Declare more specific routes first.',
+                ))
+                break
+    return messages
+
+def _cascade_cost(router, stack=()):
+    '''
+    Maximum number of cascade views a request may be passed to, before
+    one handles it (counting nested cascades).
+    '''
+    if router in stack :
+        return 0
+    cost = 0
+    for view in router.cascade_to :
+        view = _resolve(view)
+        cost += 1
+        if isinstance(view, Router) :
+            cost += _cascade_cost(view, stack + (router,))
+    return cost
+
+def _check_cascade(router):
+    messages = []
+    limit = getattr(settings, 'SUBSERVER_MAX_CASCADE', DEFAULT_MAX_CASCADE)
+    cost = _cascade_cost(router)
+    if cost > limit :
+        messages.append(_warning(
+            f'Requests not matching any route may be passed to {cost} cascade views (including nested cascades).',
+            router, 'W002',
+            hint=f'Each cascade view is tried in turn. Consider routing to them by prefix instead. (Limit set by SUBSERVER_MAX_CASCADE, currently {limit}.)',
+        ))
+    for index, view in enumerate(router.cascade_to) :
+        view = _resolve(view)
+        if isinstance(view, Router) and view.__class__.prepare not in (Router.prepare, AsyncRouter.prepare) :
+            messages.append(_warning(
+                f'cascade[{index}] ({view._router_name()}) overrides prepare(), which runs for every request that reaches it, even if it has no matching route.',
+                router, 'W003',
+                hint='Move the work into a route (so it only runs for matching requests), or make prepare() cheap.',
+            ))
+    return messages
+
+def _check_patterns(router):
+    messages = []
+    for pattern, view in router.routes :
+        problems = []
+        if sum(param.multi_segment for param in pattern._params) > 1 :
+            problems.append('it has more than one multi-segment param')
+        for index in range(2, len(pattern._parts) - 1, 2) :
+            if pattern._parts[index] == '' :
+                problems.append('it has adjacent params, with no literal text between them')
+                break
+        for param in pattern._params :
+            if _nested_quantifier.search(param.regex) :
+                problems.append(f'the regex of converter "{param.type}" has nested quantifiers')
+        for problem in problems :
+            messages.append(_warning(
+                f'Pattern "{pattern.pattern}" may backtrack badly: {problem}.',
+                router, 'W004',
+                hint='Separate params with literal text, and avoid ambiguous converter regexes.',
+            ))
+    return messages
@@ -0,0 +1,204 @@
+'''
+Single-flight request coalescing.
+
+Wrap any (expensive) SubView where it's installed:
+
+    class ApiRouter(Router):
+        routes = {
+            'reports/': coalesced(ReportsRouter()),
+        }
+
+While a request is being handled, identical requests (same method, scheme,
+host, path, query string and selected headers) wait for it, rather than
+doing the same work again, and then get a copy of its response (or its
+exception).
+'''
+
+import asyncio
+import copy
+import pickle
+from threading import Event, Lock
+from typing import Iterable, Optional
+
+from django import http
+
+from .base import SubView, is_async_view
+
+class _Flight:
+    '''
+    A request being handled by a "leader", which "followers" wait for.
+    '''
+    __slots__ = ('done', 'followers', 'pickled', 'exception')
+    def __init__(self, done):
+        self.done = done
+        # The response is only pickled if this is non-zero
+        self.followers = 0
+        # pickled response, or None if it couldn't be shared
+        self.pickled = None
+        self.exception = None
+
+def _share(response):
+    '''
+    Returns the response pickled (so each follower can get its own copy),
+    or None if it can't be shared.
+    '''
+    if isinstance(response, http.StreamingHttpResponse) :
+        return None
+    try :
+        return pickle.dumps(response, pickle.HIGHEST_PROTOCOL)
+    except Exception :
+        return None
+
+def _copy_exception(exception):
+    # So that followers raising it don't all modify the same traceback
+    try :
+        return copy.copy(exception)
+    except Exception :
+        return exception
+
+class CoalescedView(SubView):
+    '''
+    Calls view, coalescing concurrent identical requests (in this process).
+
+    headers:
+        names of request headers which must also match for requests to be
+        considered identical (ie. ['Accept', 'Accept-Language'])
+    methods:
+        request methods to coalesce (only safe methods make sense)
+    timeout:
+        maximum seconds a follower waits for the leader. After that, it
+        handles the request itself.
+
+    Responses are shared by pickling them once (only if any followers are
+    waiting), and unpickling a copy for each follower (like Django's cache
+    framework does). Streaming and
+    unpicklable responses can't be shared, and neither can the leader being
+    interrupted (ie. cancelled); followers then handle the request themselves.
+
+    executed and coalesced count requests that did and didn't call view.
+
+    Note - the leader's response is shared with every follower, so don't
+    wrap views whose responses depend on the user (unless you include the
+    relevant headers, ie. 'Cookie', in headers).
+    '''
+    def __init__(self, view: SubView, headers: Iterable[str] = (), methods: Iterable[str] = ('GET', 'HEAD'), timeout: Optional[float] = 60):
+        self.view = view
+        self.headers = list(headers)
+        self.methods = frozenset(methods)
+        self.timeout = timeout
+        self.executed = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = Lock()
+
+    def _key(self, request):
+        return (
+            request.method,
+            request.scheme,
+            request.get_host(),
+            request.path,
+            request.META.get('QUERY_STRING', ''),
+            tuple(request.headers.get(name) for name in self.headers),
+        )
+
+    def _follow(self, flight):
+        '''
+        Returns the leader's response (or raises its exception).
+        '''
+        if flight.exception is not None :
+            raise _copy_exception(flight.exception)
+        return pickle.loads(flight.pickled)
+
+    def __call__(self, request, **kwargs):
+        if request.method not in self.methods :
+            return self.view(request, **kwargs)
+
+        key = self._key(request)
+        with self._lock :
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader :
+                flight = self._flights[key] = _Flight(Event())
+            else :
+                flight.followers += 1
+
+        if not leader :
+            if flight.done.wait(self.timeout) and (flight.exception is not None or flight.pickled is not None) :
+                with self._lock :
+                    self.coalesced += 1
+                return self._follow(flight)
+            with self._lock :
+                self.executed += 1
+            return self.view(request, **kwargs)
+
+        response = None
+        try :
+            response = self.view(request, **kwargs)
+            return response
+        except Exception as e :
+            flight.exception = e
+            raise
+        finally :
+            with self._lock :
+                self.executed += 1
+                # No followers can join after this
+                del self._flights[key]
+                followers = flight.followers
+            if followers and response is not None :
+                flight.pickled = _share(response)
+            flight.done.set()
+
+class AsyncCoalescedView(CoalescedView):
+    '''
+    CoalescedView for async views. Coalesces requests handled on the same
+    event loop (ie. in the same ASGI worker).
+
+    Flights are keyed by event loop, so only one loop ever touches each.
+    The counters are shared, so they're updated under our lock.
+    '''
+    async def __call__(self, request, **kwargs):
+        if request.method not in self.methods :
+            return await self.view(request, **kwargs)
+
+        # Note - no await between checking and adding, so no lock needed
+        key = (asyncio.get_running_loop(), self._key(request))
+        flight = self._flights.get(key)
+        if flight is not None :
+            flight.followers += 1
+            try :
+                await asyncio.wait_for(asyncio.shield(flight.done.wait()), self.timeout)
+            except asyncio.TimeoutError :
+                pass
+            else :
+                if flight.exception is not None or flight.pickled is not None :
+                    with self._lock :
+                        self.coalesced += 1
+                    return self._follow(flight)
+            with self._lock :
+                self.executed += 1
+            return await self.view(request, **kwargs)
+
+        flight = self._flights[key] = _Flight(asyncio.Event())
+        response = None
+        try :
+            response = await self.view(request, **kwargs)
+            return response
+        except Exception as e :
+            flight.exception = e
+            raise
+        finally :
+            with self._lock :
+                self.executed += 1
+            del self._flights[key]
+            if flight.followers and response is not None :
+                flight.pickled = _share(response)
+            flight.done.set()
+
+def coalesced(view: SubView, **options) -> CoalescedView :
+    '''
+    Returns a CoalescedView (or AsyncCoalescedView, if view is async)
+    wrapping view. See CoalescedView for options.
+    '''
+    if is_async_view(view) :
+        return AsyncCoalescedView(view, **options)
+    return CoalescedView(view, **options)
@@ -0,0 +1,155 @@
+'''
+Implementation of Router.explain().
+'''
+
+from django.http import HttpRequest
+from time import perf_counter
+from typing import List, NamedTuple
+
+from .base import SubRequest
+
+class ExplainStep(NamedTuple):
+    # nesting level (0 for the Router explain() was called on)
+    depth: int
+    # class name of the Router taking this step
+    router: str
+    # one of 'root_view', 'match', 'try', 'cascade', 'path_view', 'not_found', 'view'
+    kind: str
+    # pattern, or description of view
+    detail: str
+    # outcome of the step
+    result: str
+    seconds: float = 0.0
+
+class Explanation:
+    '''
+    Result of Router.explain().
+
+    steps: every step taken while resolving the path
+    view: the view which would handle the request (or None, if it would 404)
+    captures: the params that view would be called with
+    certain: False if resolution reached a (non-Router) cascade view,
+        which we didn't call. It may return NOT_FOUND, in which case
+        later cascade views (and path_view) would be tried.
+    '''
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.steps: List[ExplainStep] = []
+        self.view = None
+        self.captures = {}
+        self.certain = True
+
+    def __str__(self):
+        lines = [f'{self.method} {self.path}']
+        for step in self.steps :
+            line = f'{"  " * step.depth}{step.router} {step.kind}'
+            if step.detail :
+                line += f' {step.detail}'
+            line += f': {step.result}'
+            if step.seconds :
+                line += f' ({step.seconds*1e6:.1f}us)'
+            lines.append(line)
+        if self.view is None :
+            lines.append('=> 404')
+        else :
+            lines.append(f'=> {_describe(self.view)}{"" if self.certain else " (uncertain; cascade view not run)"}')
+        return '\n'.join(lines)
+
+def _describe(view):
+    if hasattr(view, '__qualname__') :
+        return f'{getattr(view, "__module__", "")}.{view.__qualname__}'
+    cls = view.__class__
+    return f'{cls.__module__}.{cls.__qualname__}()'
+
+def explain(router, path, method='GET') -> Explanation :
+    '''
+    See Router.explain()
+    '''
+    if isinstance(path, SubRequest) :
+        request = path
+    else :
+        if not path.startswith('/') :
+            raise ValueError('path must start with "/"')
+        http_request = HttpRequest()
+        http_request.path = http_request.path_info = path
+        http_request.method = method
+        request = SubRequest(http_request)
+    explanation = Explanation(request.method, request.path)
+    _explain(router, request, 0, explanation)
+    return explanation
+
+def _explain(router, request, depth, explanation) -> bool :
+    '''
+    Appends router's steps to explanation.
+    Returns True if some view (would) handle the request.
+    '''
+    from .router import Router, _resolve
+
+    name = router._router_name()
+    def step(kind, detail, result, seconds=0.0):
+        explanation.steps.append(ExplainStep(depth, name, kind, detail, result, seconds))
+
+    def handled_by(view, sub_request, captures={}):
+        '''
+        Recurses into Routers. Records any other view as the result.
+        '''
+        if isinstance(view, Router) :
+            return _explain(view, sub_request, depth+1, explanation)
+        step('view', _describe(view), 'would be called (not run)')
+        explanation.view = view
+        explanation.captures = captures
+        return True
+
+    path = request._request.path
+    pos = request._parent_path_length
+
+    if pos == len(path) and router._root_view :
+        step('root_view', '', 'sub_path is empty')
+        return handled_by(router.__class__.root_view, request)
+
+    # Same lookup as production, but bypassing the route cache (if any),
+    # so we don't affect its hit/miss stats. Results are the same.
+    start = perf_counter()
+    resolved = router._route_table.match(path, pos)
+    seconds = perf_counter() - start
+    if resolved :
+        index, end, captures = resolved
+        matched = router.routes[index][0].pattern
+        step('match', repr(request.sub_path), f'{matched} {captures}', seconds)
+    else :
+        index = len(router.routes)
+        step('match', repr(request.sub_path), 'no route matched', seconds)
+
+    # Try each Pattern in order, up to the match, to show what each one costs
+    for pattern, view in router.routes[:index+1] :
+        start = perf_counter()
+        try :
+            pattern_end, pattern_captures = pattern.match_at(path, pos)
+            result = f'match {pattern_captures}'
+        except ValueError as e :
+            result = 'no match'
+            if not pattern.literal and pattern._compiled.match(path, pos) :
+                result = f'converter rejected ({e})'
+        step('try', pattern.pattern, result, perf_counter() - start)
+
+    if resolved :
+        view = _resolve(router.routes[index][1])
+        return handled_by(view, request._advance(end), captures)
+
+    for cascade_index, view in enumerate(router.cascade_to) :
+        view = _resolve(view)
+        step('cascade', f'[{cascade_index}]', _describe(view))
+        if isinstance(view, Router) :
+            if _explain(view, request, depth+1, explanation) :
+                return True
+            continue
+        explanation.certain = False
+        return handled_by(view, request)
+
+    if pos < len(path) and router._path_view :
+        step('path_view', '', 'sub_path not handled by routes or cascade')
+        return handled_by(router.__class__.path_view, request)
+
+    step('not_found', '', 'NOT_FOUND' if router.return_not_found else 'Http404')
+    return False
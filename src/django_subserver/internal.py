@@ -0,0 +1,115 @@
+'''
+Implementation of Router.call_internal().
+'''
+
+import copy
+import io
+from django.http import HttpRequest, QueryDict
+from django.utils.datastructures import MultiValueDict
+from typing import Union
+
+from .base import SubRequest
+
+# Methods whose responses may be stored in a fragment cache
+CACHEABLE_METHODS = frozenset(('GET', 'HEAD'))
+
+# Request attributes which must not carry over from the parent request
+_PARENT_ONLY = (
+    # cached_properties, computed from the parent's META/query string
+    'headers',
+    'GET',
+    # module_view.request_memo() - the derived request is a separate request
+    '_django_subserver_memo',
+)
+
+def derived_request(parent_request: Union[HttpRequest, SubRequest], path: str, method: str = 'GET', mount_path: str = '/') -> SubRequest :
+    '''
+    Returns a new SubRequest for method and path (relative to mount_path,
+    optionally with a query string), with parent_path == mount_path.
+
+    mount_path (like request.path) includes any script prefix; path_info
+    is derived by removing the parent's script prefix.
+
+    The underlying HttpRequest is a shallow copy of parent_request's, so it
+    shares META (other than the path, method, query string and content
+    headers), cookies, user, session, resolver_match, etc. It has an empty
+    body. Custom data added to parent_request (if it's a SubRequest) is not
+    copied.
+    '''
+    if isinstance(parent_request, SubRequest) :
+        parent_request = parent_request.request
+    if not (mount_path.startswith('/') and mount_path.endswith('/')) :
+        raise ValueError('mount_path must start and end with "/"')
+    if path.startswith('/') :
+        raise ValueError('path must be relative to mount_path (not start with "/")')
+
+    sub_path, _, query_string = path.partition('?')
+    full_path = mount_path + sub_path
+    method = method.upper()
+
+    request = copy.copy(parent_request)
+    data = request.__dict__
+    for attr in _PARENT_ONLY :
+        data.pop(attr, None)
+
+    # Shares per-request state with its root request (see loading.request_loaders)
+    request._django_subserver_root = getattr(parent_request, '_django_subserver_root', parent_request)
+    # path = script prefix (SCRIPT_NAME) + path_info
+    script_prefix = _script_prefix(parent_request)
+    if full_path.startswith(script_prefix) :
+        path_info = full_path[len(script_prefix):]
+    else :
+        path_info = full_path
+    request.path = full_path
+    request.path_info = path_info
+    request.method = method
+    meta = request.META = parent_request.META.copy()
+    meta['REQUEST_METHOD'] = method
+    meta['PATH_INFO'] = path_info
+    meta['QUERY_STRING'] = query_string
+    meta.pop('CONTENT_TYPE', None)
+    meta.pop('CONTENT_LENGTH', None)
+    # As HttpRequest/WSGIRequest set them, for a request without Content-Type
+    request.content_type = ''
+    request.content_params = {}
+    request.GET = QueryDict(query_string, encoding=parent_request.encoding)
+
+    # Empty body (whether or not the parent's has been read)
+    request._body = b''
+    request._stream = io.BytesIO()
+    request._read_started = False
+    request._post = QueryDict()
+    request._files = MultiValueDict()
+    if 'POST' in data :
+        # Plain HttpRequest (not WSGIRequest/ASGIRequest) stores these directly
+        request.POST = request._post
+        request.FILES = request._files
+
+    sub_request = SubRequest(request)
+    return sub_request._advance(len(mount_path))
+
+def _script_prefix(request):
+    '''
+    The part of request.path before path_info (ie. SCRIPT_NAME, without
+    a trailing "/").
+    '''
+    path, path_info = request.path, request.path_info
+    if path_info and path.endswith(path_info) :
+        return path[:len(path) - len(path_info)]
+    return ''
+
+def needs_render(response) -> bool :
+    '''
+    True if response is an unrendered (Simple)TemplateResponse.
+    Django's handler renders these, but call_internal() bypasses it.
+    '''
+    render = getattr(response, 'render', None)
+    return callable(render) and not getattr(response, 'is_rendered', True)
+
+def fragment_key(request: SubRequest):
+    '''
+    Key of request in a fragment cache, or None if it's not cacheable.
+    '''
+    if request.method not in CACHEABLE_METHODS :
+        return None
+    return (request.method, request.get_full_path())
@@ -0,0 +1,250 @@
+'''
+DataLoader-style batched loading of objects, per request.
+
+Routers declare loaders: functions taking a list of keys, and returning
+either a mapping of key -> object (ie. Model.objects.in_bulk), or a list
+of objects in the same order as keys. prepare() then gets objects through
+them:
+
+    class ProjectRouter(Router):
+        loaders = {
+            'project': lambda ids: Project.objects.in_bulk(ids),
+        }
+        def prepare(self, request, project_id):
+            request.project = self.loader(request, 'project').load(project_id)
+
+Every SubRequest for the same HttpRequest (including requests derived via
+Router.call_internal(), ie. fragments and batch items) shares one set of
+loaders, so each object is loaded at most once per request, and keys
+requested together are loaded with a single call.
+
+Sync loaders batch every key deferred (with defer()) before the first one
+is needed. Async loaders (used by AsyncRouters) batch every key requested
+in the same tick of the event loop, like JavaScript's DataLoader.
+'''
+
+import asyncio
+from asgiref.sync import sync_to_async
+from collections.abc import Mapping
+from django.http import Http404
+from threading import Lock, RLock
+from typing import Callable, Hashable, List
+
+from .base import SubRequest, is_async_view
+
+# Stored on a key's loaded value, when batch_load didn't return it
+_missing = object()
+
+class Deferred:
+    '''
+    A key queued with Loader.defer().
+    '''
+    __slots__ = ('loader', 'key')
+    def __init__(self, loader, key):
+        self.loader = loader
+        self.key = key
+
+    def get(self):
+        '''
+        Returns the object, loading it (and every other queued key) if
+        necessary. Raises Http404 if it doesn't exist.
+        '''
+        return self.loader.load(self.key)
+
+class Loader:
+    '''
+    Loads objects via batch_load, caching them for the life of the request.
+    If batch_load returns a list, None means "doesn't exist".
+
+    calls counts calls to batch_load.
+
+    Thread safe (items of a batch request may share a loader).
+    '''
+    def __init__(self, batch_load: Callable):
+        self.batch_load = batch_load
+        self.calls = 0
+        # key -> object (or _missing)
+        self._values = {}
+        self._pending = {}
+        self._lock = RLock()
+
+    def defer(self, key: Hashable) -> Deferred :
+        '''
+        Queues key to be loaded (with any other queued keys) when the
+        result of this, or any other defer() or load(), is needed.
+        '''
+        with self._lock :
+            if key not in self._values :
+                self._pending[key] = None
+        return Deferred(self, key)
+
+    def load(self, key: Hashable):
+        '''
+        Returns the object for key. Raises Http404 if it doesn't exist.
+        '''
+        with self._lock :
+            try :
+                value = self._values[key]
+            except KeyError :
+                self._pending[key] = None
+                self._dispatch()
+                value = self._values[key]
+        if value is _missing :
+            raise Http404()
+        return value
+
+    def load_many(self, keys: List[Hashable]) -> list :
+        '''
+        Returns the objects for keys, loaded in (at most) one call.
+        Raises Http404 if any don't exist.
+        '''
+        deferred = [self.defer(key) for key in keys]
+        return [item.get() for item in deferred]
+
+    def prime(self, key: Hashable, value):
+        '''
+        Caches value for key (ie. an object you already have).
+        '''
+        with self._lock :
+            self._values[key] = value
+            self._pending.pop(key, None)
+
+    def clear(self, key: Hashable):
+        '''
+        Forgets key, so it's loaded again next time (ie. after saving it).
+        '''
+        with self._lock :
+            self._values.pop(key, None)
+
+    def _dispatch(self):
+        keys = list(self._pending)
+        self._pending.clear()
+        self._values.update(self._results(keys, self.batch_load(keys)))
+
+    def _results(self, keys, results) -> dict :
+        '''
+        Returns key -> object (or _missing), given what batch_load returned.
+        '''
+        self.calls += 1
+        if isinstance(results, Mapping) :
+            return {key: results.get(key, _missing) for key in keys}
+        results = list(results)
+        if len(results) != len(keys) :
+            raise ValueError(f'{self.batch_load!r} returned {len(results)} objects for {len(keys)} keys')
+        return {key: _missing if value is None else value for key, value in zip(keys, results)}
+
+class AsyncLoader(Loader):
+    '''
+    Loader for async code. load() and load_many() return awaitables.
+
+    batch_load may be a coroutine function. Otherwise it's called via
+    sync_to_async (so it can use the ORM).
+    '''
+    def __init__(self, batch_load: Callable):
+        super().__init__(batch_load)
+        # key -> Future
+        self._futures = {}
+        self._scheduled = False
+
+    def defer(self, key: Hashable) -> asyncio.Future :
+        return self.load(key)
+
+    def load(self, key: Hashable) -> asyncio.Future :
+        '''
+        Returns a Future for the object. Every key requested before the
+        event loop next runs other tasks is loaded with one call.
+        '''
+        future = self._futures.get(key)
+        if future is None :
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            self._pending[key] = None
+            if not self._scheduled :
+                self._scheduled = True
+                loop.call_soon(self._dispatch_soon)
+        return future
+
+    def load_many(self, keys: List[Hashable]) -> asyncio.Future :
+        return asyncio.gather(*(self.load(key) for key in keys))
+
+    def prime(self, key: Hashable, value):
+        future = self._futures.get(key)
+        if future is None or future.done() :
+            future = self._futures[key] = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        self._pending.pop(key, None)
+
+    def clear(self, key: Hashable):
+        future = self._futures.get(key)
+        if future is not None and future.done() :
+            del self._futures[key]
+
+    def _dispatch_soon(self):
+        self._scheduled = False
+        keys = list(self._pending)
+        self._pending.clear()
+        if keys :
+            asyncio.ensure_future(self._dispatch_keys(keys))
+
+    async def _dispatch_keys(self, keys):
+        try :
+            if is_async_view(self.batch_load) :
+                results = await self.batch_load(keys)
+            else :
+                results = await sync_to_async(self.batch_load)(keys)
+            values = self._results(keys, results)
+        except Exception as e :
+            # Not cached, so later loads retry
+            for key in keys :
+                future = self._futures[key]
+                if not future.done() :
+                    del self._futures[key]
+                    future.set_exception(e)
+            return
+        for key, value in values.items() :
+            future = self._futures[key]
+            if future.done() :
+                # primed meanwhile
+                continue
+            if value is _missing :
+                future.set_exception(Http404())
+            else :
+                future.set_result(value)
+
+# Guards creation of registries, and of loaders within them
+_registry_lock = Lock()
+
+def request_loaders(request) -> dict :
+    '''
+    Returns the loader registry (batch_load function -> Loader) of
+    request's root HttpRequest (shared by every request derived from it).
+    '''
+    if isinstance(request, SubRequest) :
+        request = request.request
+    root = getattr(request, '_django_subserver_root', request)
+    try :
+        return root._django_subserver_loaders
+    except AttributeError :
+        pass
+    with _registry_lock :
+        try :
+            return root._django_subserver_loaders
+        except AttributeError :
+            registry = root._django_subserver_loaders = {}
+            return registry
+
+def get_loader(request, batch_load: Callable, loader_class=Loader) -> Loader :
+    '''
+    Returns the request's loader for batch_load (creating it, if necessary).
+    '''
+    registry = request_loaders(request)
+    key = (batch_load, loader_class)
+    try :
+        return registry[key]
+    except KeyError :
+        pass
+    with _registry_lock :
+        loader = registry.get(key)
+        if loader is None :
+            loader = registry[key] = loader_class(batch_load)
+        return loader
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpRequest
+from django.urls import Resolver404, resolve
+
+from ...router import Router
+from ...urls import _sub_request
+
+class Command(BaseCommand):
+    help = '''
+    Explains how a url would be resolved by the Router tree mounted
+    (via sub_view_urls) in your urlconf. See Router.explain().
+
+    Requires 'django_subserver' in INSTALLED_APPS.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='url path, ie. /api/reports/5/')
+        parser.add_argument('--method', default='GET')
+
+    def handle(self, path, method, **options):
+        try :
+            match = resolve(path)
+        except Resolver404 :
+            raise CommandError(f'"{path}" does not resolve in your urlconf')
+
+        router = getattr(match.func, 'sub_view', None)
+        if router is None :
+            raise CommandError(f'"{path}" resolves to {match.func!r}, which is not installed via sub_view_urls')
+        if not isinstance(router, Router) :
+            raise CommandError(f'"{path}" resolves to {router!r}, which is not a Router')
+
+        request = HttpRequest()
+        request.path = request.path_info = path
+        request.method = method.upper()
+        sub_request = _sub_request(request, match.kwargs.get('sub_path', ''))
+
+        other_kwargs = {key: value for key, value in match.kwargs.items() if key != 'sub_path'}
+        if other_kwargs :
+            self.stdout.write(f'(captured by urlconf, passed to root Router: {other_kwargs})')
+        self.stdout.write(str(router.explain(sub_request)))
@@ -0,0 +1,192 @@
+import weakref
+from bisect import bisect_left
+from collections import deque
+from threading import Lock, local
+from typing import Optional, Sequence
+
+# Same as the default buckets of the prometheus client libraries (seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+class RouteMetrics:
+    '''
+    In-process request counts and latency histograms for Routers.
+
+    Enable by setting the `metrics` attribute of a Router class (usually a
+    base class shared by all of your Routers):
+
+        METRICS = RouteMetrics()
+        class MyRouter(Router):
+            metrics = METRICS
+
+    Routers with metrics record:
+    - per router class, the time spent routing each request, and the number
+      of requests that ended in Http404/NOT_FOUND
+    - per view of that router (ie. per `routes` pattern, "cascade[i]",
+      "root_view" or "path_view"), the same. For cascade views, not_found
+      is the number of cascade misses.
+
+    Stats are keyed on router class and pattern (never on the actual path),
+    so the number of series is bounded by the size of your code.
+
+    Note - after compile_tree(), routes merged from pass-through Routers
+    are recorded against the parent Router, with the combined pattern.
+
+    Recording never takes a lock. Each thread records into its own shard,
+    and shards are only combined by snapshot()/prometheus_text(). Once a
+    thread exits, its shard is folded into a shared total (so servers
+    starting a thread per request don't accumulate shards).
+    '''
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._local = local()
+        # id(shard) -> shard, for live threads (and dead ones not yet folded)
+        self._shards = {}
+        # Stats of dead threads
+        self._retired = {}
+        # Shards of dead threads, waiting to be folded into _retired
+        self._dead = deque()
+        self._shards_lock = Lock()
+
+    def _new_shard(self):
+        shard = self._local.shard = {}
+        # Only referenced by the thread-local, so freed when the thread exits.
+        # The finalizer may run in any thread (during garbage collection),
+        # so it doesn't take a lock; deque.append is atomic.
+        holder = self._local.holder = _ShardHolder()
+        weakref.finalize(holder, self._dead.append, shard).atexit = False
+        with self._shards_lock :
+            self._fold_dead()
+            self._shards[id(shard)] = shard
+        return shard
+
+    def _fold_dead(self):
+        '''
+        Merges shards of dead threads into _retired.
+        Call with _shards_lock held.
+        '''
+        while self._dead :
+            shard = self._dead.popleft()
+            if self._shards.pop(id(shard), None) is not None :
+                _merge(self._retired, shard)
+
+    def record(self, router: str, view: Optional[str], seconds: float, not_found: bool = False):
+        '''
+        Note: end users aren't likely to ever need this.
+        view is None for the router as a whole.
+        '''
+        shard = getattr(self._local, 'shard', None)
+        if shard is None :
+            shard = self._new_shard()
+        key = (router, view)
+        stats = shard.get(key)
+        if stats is None :
+            # [count, sum, not_found, *bucket counts (last is +Inf)]
+            stats = shard[key] = [0, 0.0, 0] + [0] * (len(self.buckets) + 1)
+        stats[0] += 1
+        stats[1] += seconds
+        if not_found :
+            stats[2] += 1
+        stats[3 + bisect_left(self.buckets, seconds)] += 1
+
+    def reset(self):
+        '''
+        Discards everything recorded so far.
+        '''
+        with self._shards_lock :
+            for shard in self._shards.values() :
+                shard.clear()
+            self._retired.clear()
+
+    def _totals(self):
+        with self._shards_lock :
+            self._fold_dead()
+            totals = {key: list(stats) for key, stats in self._retired.items()}
+            shards = list(self._shards.values())
+        for shard in shards :
+            _merge(totals, shard)
+        return totals
+
+    def _stats_dict(self, stats):
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.buckets + (float('inf'),), stats[3:]) :
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return dict(count=stats[0], sum=stats[1], not_found=stats[2], buckets=buckets)
+
+    def snapshot(self) -> dict :
+        '''
+        Returns:
+        {
+            router class name: {
+                'total': stats,
+                'views': {view label: stats},
+            },
+        }
+        where stats is a dict of count, sum (seconds), not_found, and
+        buckets (a list of (upper bound, cumulative count)).
+        '''
+        result = {}
+        for (router, view), stats in sorted(self._totals().items(), key=lambda item: (item[0][0], item[0][1] or '')) :
+            entry = result.setdefault(router, dict(total=None, views={}))
+            if view is None :
+                entry['total'] = self._stats_dict(stats)
+            else :
+                entry['views'][view] = self._stats_dict(stats)
+        return result
+
+    def prometheus_text(self, prefix: str = 'subserver') -> str :
+        '''
+        Returns our stats in the Prometheus text exposition format.
+        '''
+        routers = []
+        views = []
+        for router, entry in self.snapshot().items() :
+            if entry['total'] :
+                routers.append((dict(router=router), entry['total']))
+            for view, stats in entry['views'].items() :
+                views.append((dict(router=router, view=view), stats))
+
+        lines = []
+        for name, description, series in [
+            (f'{prefix}_router', 'Time spent routing requests, per Router class', routers),
+            (f'{prefix}_view', 'Time spent in each route/cascade view, per Router class', views),
+        ] :
+            lines.append(f'# HELP {name}_seconds {description}')
+            lines.append(f'# TYPE {name}_seconds histogram')
+            for labels, stats in series :
+                for bound, count in stats['buckets'] :
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{name}_seconds_bucket{_labels(labels, le=le)} {count}')
+                lines.append(f'{name}_seconds_sum{_labels(labels)} {stats["sum"]!r}')
+                lines.append(f'{name}_seconds_count{_labels(labels)} {stats["count"]}')
+            lines.append(f'# HELP {name}_not_found_total Requests that ended in Http404 or NOT_FOUND')
+            lines.append(f'# TYPE {name}_not_found_total counter')
+            for labels, stats in series :
+                lines.append(f'{name}_not_found_total{_labels(labels)} {stats["not_found"]}')
+        return '\n'.join(lines) + '\n'
+
+class _ShardHolder:
+    '''
+    Stored in a thread-local, so we know when the thread is gone.
+    '''
+    __slots__ = ('__weakref__',)
+
+def _merge(totals, shard):
+    for key, stats in list(shard.items()) :
+        total = totals.get(key)
+        if total is None :
+            totals[key] = list(stats)
+        else :
+            for index, value in enumerate(stats) :
+                total[index] += value
+
+def _labels(labels, **extra):
+    labels = dict(labels, **extra)
+    return '{' + ','.join(
+        f'{key}="{_escape(value)}"'
+        for key, value in labels.items()
+    ) + '}'
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
@@ -1,20 +1,189 @@
 '''
-Note - this module is actually completely independent of the rest of django_subserver.
+Note - this module is actually completely independent of the rest of django_subserver
+(except for the tracing hooks, which are also independent).
 '''
 
+from asgiref.sync import sync_to_async
 from django import http
 from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from datetime import timezone as dt_timezone
+from functools import wraps
 from importlib import import_module
-from typing import Callable
+from typing import Callable, Hashable, Optional
+
+from . import tracing
+
+try :
+    from asgiref.sync import iscoroutinefunction
+except ImportError :
+    from asyncio import iscoroutinefunction
 
 _known_methods = ['get', 'post', 'put', 'patch', 'delete', 'head', 'options', 'trace']
-def _options(allowed_methods):
-    if 'OPTIONS' not in allowed_methods :
-        allowed_methods += ['OPTIONS']
+
+# Note - responses are mutable (ie. middleware adds headers), so we can't
+# share instances. The Allow header is computed once, though.
+def _options(allow):
     response = http.HttpResponse()
-    response['Allow'] = ', '.join(allowed_methods)
+    response['Allow'] = allow
     response['Content-Length'] = '0'
     return response
+def _not_allowed(allow):
+    # HttpResponseNotAllowed joins the methods it's given; we give it the joined header
+    return http.HttpResponseNotAllowed((allow,))
+
+def _drop_body(response):
+    '''
+    Turns a response to GET into a response to HEAD.
+    '''
+    if isinstance(response, http.StreamingHttpResponse) :
+        # The original iterator is still closed when response is closed
+        response.streaming_content = ()
+    elif isinstance(response, http.HttpResponse) :
+        # 1xx/204/304 responses never have a body (or Content-Length of the
+        # body they'd have had), so there's nothing to do
+        if response.status_code < 200 or response.status_code in (204, 304) :
+            return response
+        if not response.has_header('Content-Length') :
+            response['Content-Length'] = str(len(response.content))
+        response.content = b''
+    return response
+
+def _validators(etag, last_modified):
+    '''
+    Converts the results of handle_etag/handle_last_modified to the form
+    get_conditional_response() expects.
+    '''
+    if etag is not None :
+        # May or may not already be quoted
+        etag = quote_etag(etag)
+    if last_modified :
+        if not timezone.is_aware(last_modified) :
+            last_modified = timezone.make_aware(last_modified, dt_timezone.utc)
+        last_modified = int(last_modified.timestamp())
+    return etag, last_modified
+
+def _set_validators(response, etag, last_modified):
+    if not isinstance(response, http.HttpResponseBase) :
+        return
+    if last_modified and not response.has_header('Last-Modified') :
+        response['Last-Modified'] = http_date(last_modified)
+    if etag and not response.has_header('ETag') :
+        response['ETag'] = etag
+
+def _conditional(handler, handle_etag, handle_last_modified):
+    '''
+    Wraps handler (handle_get or handle_head), so that it isn't called if
+    the request's If-None-Match/If-Modified-Since headers match.
+    Similar to django.views.decorators.http.condition.
+    '''
+    if any(iscoroutinefunction(function) for function in (handler, handle_etag, handle_last_modified)) :
+        async def call(function, request):
+            if function is None :
+                return None
+            if iscoroutinefunction(function) :
+                return await function(request)
+            return await sync_to_async(function)(request)
+        async def conditional_handler(request):
+            etag, last_modified = _validators(
+                await call(handle_etag, request),
+                await call(handle_last_modified, request),
+            )
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None :
+                response = await call(handler, request)
+            # Including on 304 responses (as required by RFC 9110)
+            _set_validators(response, etag, last_modified)
+            return response
+    else :
+        def conditional_handler(request):
+            etag, last_modified = _validators(
+                handle_etag and handle_etag(request),
+                handle_last_modified and handle_last_modified(request),
+            )
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None :
+                response = handler(request)
+            # Including on 304 responses (as required by RFC 9110)
+            _set_validators(response, etag, last_modified)
+            return response
+    return conditional_handler
+
+def request_memo(request) -> dict :
+    '''
+    Returns a dict for caching data for the rest of the request.
+
+    request may be an HttpRequest, or a SubRequest. The same dict is
+    returned for every SubRequest of a given HttpRequest (ie. at every
+    routing level, and in every cascade view attempted).
+    '''
+    # SubRequest -> HttpRequest
+    http_request = getattr(request, 'request', request)
+    try :
+        return http_request._django_subserver_memo
+    except AttributeError :
+        memo = http_request._django_subserver_memo = {}
+        return memo
+
+def memoize_per_request(key: Optional[Hashable] = None):
+    '''
+    Decorator for functions taking just a request (ie. handle_auth).
+    The function is called at most once per request (per key). Later
+    calls (for the same request) return the first result.
+
+    key defaults to the function itself. Give the same key to different
+    functions that perform the same check.
+
+    Usage:
+        @memoize_per_request('staff')
+        def handle_auth(request):
+            if not request.user.is_staff :
+                return HttpResponseForbidden()
+
+    May also be used without arguments (@memoize_per_request), in which
+    case key can't be a callable.
+    '''
+    if callable(key) :
+        # Used bare, so we were given the function
+        return memoize_per_request()(key)
+    def decorator(function):
+        memo_key = function if key is None else key
+        if iscoroutinefunction(function) :
+            @wraps(function)
+            async def memoized(request):
+                memo = request_memo(request)
+                try :
+                    return memo[memo_key]
+                except KeyError :
+                    pass
+                result = memo[memo_key] = await function(request)
+                return result
+        else :
+            @wraps(function)
+            def memoized(request):
+                memo = request_memo(request)
+                try :
+                    return memo[memo_key]
+                except KeyError :
+                    pass
+                result = memo[memo_key] = function(request)
+                return result
+        return memoized
+    return decorator
+
+def _head(handle_get):
+    '''
+    Returns a handle_head function, which calls handle_get.
+    '''
+    if iscoroutinefunction(handle_get) :
+        async def handle_head(request):
+            return _drop_body(await handle_get(request))
+    else :
+        def handle_head(request):
+            return _drop_body(handle_get(request))
+    return handle_head
 
 def module_view(name, package=None) -> Callable[[HttpRequest], HttpResponse]:
     '''
@@ -39,6 +208,37 @@ def module_view(name, package=None) -> Callable[[HttpRequest], HttpResponse]:
 
         We'll call the appropriate function, based on request method.
 
+        If handle_get is defined, but not handle_head, we answer HEAD
+        requests by calling handle_get, and dropping the response body.
+        If handle_options is not defined, we answer OPTIONS requests with
+        an "Allow" header. Other methods get a 405 response.
+
+        Any of these may be coroutine functions ("async def"). If so, the
+        returned view is also a coroutine function, and any sync handlers
+        are wrapped with sync_to_async (so only they switch threads).
+
+    -------------------------------------------------------------------
+    handle_auth
+        (request: SubRequest) -> Optional[HttpResponse]
+
+        Called before handle_get, handle_post, etc. (but not before our
+        default OPTIONS/405 responses). If it returns a response, we return
+        that, without calling the handler. See memoize_per_request, if the
+        same check may run more than once per request (ie. in several
+        cascaded views).
+        May also be a coroutine function.
+
+    -------------------------------------------------------------------
+    handle_etag
+    handle_last_modified
+        (request: SubRequest) -> str/datetime (or None)
+
+        If either is defined, we call them before handle_get/handle_head.
+        If the request's If-None-Match/If-Modified-Since headers match
+        the results, we return a 304 response without calling the handler.
+        We set ETag/Last-Modified on the 304, or the handler's response.
+        May also be coroutine functions.
+
     -------------------------------------------------------------------
     Note: all the functions we read are prefixed with "handle_".
     This makes it less likely that you'll accidentally define a helper
@@ -55,9 +255,21 @@ def module_view(name, package=None) -> Callable[[HttpRequest], HttpResponse]:
             methods[method_name] = getattr(module, 'handle_'+method_name)
         except AttributeError :
             pass
-    allowed_methods = [name.upper() for name in methods]
+    handle_etag = getattr(module, 'handle_etag', None)
+    handle_last_modified = getattr(module, 'handle_last_modified', None)
+    if handle_etag or handle_last_modified :
+        for method_name in ('get', 'head') :
+            if method_name in methods :
+                methods[method_name] = _conditional(methods[method_name], handle_etag, handle_last_modified)
+    if 'get' in methods and 'head' not in methods :
+        methods['head'] = _head(methods['get'])
+    # Computed once, at creation. OPTIONS is always allowed.
+    allow = ', '.join(
+        name.upper() for name in _known_methods
+        if name in methods or name == 'options'
+    )
 
-    auth = getattr(module, 'handle_auth', lambda sr: None)
+    auth = getattr(module, 'handle_auth', None)
 
     def view(request):
         '''
@@ -71,11 +283,46 @@ def module_view(name, package=None) -> Callable[[HttpRequest], HttpResponse]:
             method = methods[mname]
         except KeyError :
             if mname == 'options' :
-                return _options(allowed_methods)
-            return http.HttpResponseNotAllowed(allowed_methods)
+                return _options(allow)
+            return _not_allowed(allow)
+        if auth :
+            response = auth(request)
+            if response :
+                return response
+        if tracing.tracer :
+            with tracing.tracer.span('module_view', dict(module=module.__name__, method=mname)) :
+                return method(request)
         return method(request)
 
-    return view
+    if not any(iscoroutinefunction(function) for function in [*methods.values(), auth]) :
+        return view
+
+    async_methods = {
+        name: method if iscoroutinefunction(method) else sync_to_async(method)
+        for name, method in methods.items()
+    }
+    async_auth = auth and (auth if iscoroutinefunction(auth) else sync_to_async(auth))
+    async def async_view(request):
+        '''
+        Async version of view (used if any handler is async).
+        '''
+        mname = request.method.lower()
+        try :
+            method = async_methods[mname]
+        except KeyError :
+            if mname == 'options' :
+                return _options(allow)
+            return _not_allowed(allow)
+        if async_auth :
+            response = await async_auth(request)
+            if response :
+                return response
+        if tracing.tracer :
+            with tracing.tracer.span('module_view', dict(module=module.__name__, method=mname)) :
+                return await method(request)
+        return await method(request)
+
+    return async_view
 
 def package_view_importer(package):
     '''
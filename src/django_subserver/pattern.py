@@ -1,13 +1,55 @@
-from datetime import datetime
+from datetime import date
 import re
+from typing import Any, Callable, NamedTuple
+from uuid import UUID
 
-def _get_date(string):
-	return datetime.strptime(string, '%Y-%m-%d').date()
-_converters = dict(
-	int=(int, r'-?\d+'),
-	str=(str, r'[^/]+'),
-	date=(_get_date, r'\d\d\d\d-\d\d-\d\d'),
-)
+# name -> (parse function, regex, multi_segment)
+_converters = {}
+
+def register_converter(name: str, regex: str, parse: Callable[[str], Any] = str, multi_segment: bool = False):
+	'''
+	Makes "<name:param_name>" available in Patterns (and so in Router.routes).
+	Register your converters before defining any Routers that use them.
+
+	regex:
+		matches the text of the param.
+		Must not contain capturing groups (use "(?:...)").
+	parse:
+		converts the matched text to the value passed to the view.
+		May raise ValueError, in which case the Pattern doesn't match.
+	multi_segment:
+		must be True if regex can match "/"
+	'''
+	if not re.fullmatch(r'\w+', name) :
+		raise ValueError(f'Invalid converter name: "{name}"')
+	if re.compile(regex).groups :
+		raise ValueError(f'Invalid regex for converter "{name}": must not contain capturing groups')
+	_converters[name] = (parse, regex, multi_segment)
+
+register_converter('int', r'-?\d+', int)
+register_converter('str', r'[^/]+')
+register_converter('slug', r'[-a-zA-Z0-9_]+')
+register_converter('uuid', r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', UUID)
+# Note - much faster than datetime.strptime
+register_converter('date', r'\d\d\d\d-\d\d-\d\d', date.fromisoformat)
+# Like django's path converter. Matches as much as it can (including "/").
+register_converter('path', r'.+', multi_segment=True)
+
+class _Param(NamedTuple):
+	name: str
+	type: str
+	converter: Callable[[str], Any]
+	regex: str
+	multi_segment: bool
+	# If True, the value is still converted (and may still raise ValueError),
+	# but is not included in the captures
+	discard: bool = False
+
+def _source(parts):
+	return ''.join(
+		part if index % 2 == 0 else f'<{part.type}:{part.name}>'
+		for index, part in enumerate(parts)
+	)
 
 class Pattern:
 	'''
@@ -25,16 +67,20 @@ class Pattern:
 	<str:segment>/
 	<date:open_date>/
 	authors/<int:author_id>/<date:publish_date>/
+	<uuid:token>/
+	<slug:slug>/
+	files/<path:file_path>/
+
+	See register_converter() to add your own converters.
 	'''
 	def __init__(self, pattern):
 		if not pattern.endswith('/') :
 			raise ValueError(f'Invalid Pattern: "{pattern}". Must end with "/" ')
 
-		regex = ''
-		types = []
+		parts = []
 		for index, part in enumerate(re.split(r'<(\w+:?\w*)>', pattern)) :
 			if index % 2 == 0 :
-				regex += re.escape(part)
+				parts.append(part)
 			else :
 				try :
 					converter, converter_name = part.split(':')
@@ -43,15 +89,124 @@ class Pattern:
 				if not converter_name :
 					raise ValueError(f'Invalid caturing param: <{part}>. Name must not be empty.')
 				try :
-					converter, converter_regex = _converters[converter]
+					converter_function, converter_regex, multi_segment = _converters[converter]
 				except KeyError :
 					raise ValueError(f'Invalid converter "{converter}" in pattern "{pattern}"')
+				parts.append(_Param(converter_name, converter, converter_function, converter_regex, multi_segment))
+
+		self._init_parts(parts)
+
+	def _init_parts(self, parts):
+		self.pattern = _source(parts)
+		# Alternating literal strings and _Params
+		self._parts = parts
+		self._params = parts[1::2]
+		self._regex = self.regex()
+		self._compiled = re.compile(self._regex)
+
+	@classmethod
+	def _from_parts(cls, parts):
+		instance = cls.__new__(cls)
+		instance._init_parts(parts)
+		return instance
+
+	def __repr__(self):
+		return f'Pattern({self.pattern!r})'
+
+	@property
+	def multi_segment(self):
+		'''
+		True if any of our params can match more than one path segment.
+		'''
+		return any(param.multi_segment for param in self._params)
+
+	@property
+	def literal(self):
+		'''
+		True if the pattern has no capturing params
+		(so it can be matched with a simple prefix comparison).
+		'''
+		return not self._params
+
+	def followed_by(self, other: 'Pattern') -> 'Pattern' :
+		'''
+		Returns a Pattern that matches self, and then other.
+
+		Our own captures are still converted (so converter failures still
+		reject the match), but only the captures of other are returned.
+		This mirrors what happens when a Router routes to another Router
+		which doesn't override prepare().
+		'''
+		own = [
+			part if index % 2 == 0 else part._replace(discard=True)
+			for index, part in enumerate(self._parts)
+		]
+		parts = own[:-1] + [own[-1] + other._parts[0]] + other._parts[1:]
+		return Pattern._from_parts(parts)
+
+	def split_first_segment(self) -> tuple :
+		'''
+		Returns (head, rest), where head is a Pattern matching just the
+		first path segment, and rest is a Pattern for everything after it
+		(or None, if nothing follows the first segment).
+		'''
+		for index in range(0, len(self._parts), 2) :
+			literal = self._parts[index]
+			if '/' in literal :
+				break
+		before, after = literal.split('/', 1)
+		head = Pattern._from_parts(self._parts[:index] + [before+'/'])
+		if index == len(self._parts) - 1 and not after :
+			return head, None
+		return head, Pattern._from_parts([after] + self._parts[index+1:])
 
-				regex += f'(?P<{converter_name}>{converter_regex})'
-				types.append((converter_name, converter))
+	def regex(self, group_prefix=None) -> str :
+		'''
+		Returns our regex source.
 
-		self._regex = regex
-		self._types = types
+		By default, each capturing param becomes a group named after the param.
+		If group_prefix is given, groups are instead named group_prefix+index,
+		so that several patterns can be combined into a single regex.
+		'''
+		regex = ''
+		for index, part in enumerate(self._parts) :
+			if index % 2 == 0 :
+				regex += re.escape(part)
+			else :
+				name = part.name
+				if group_prefix is not None :
+					name = f'{group_prefix}{index // 2}'
+				elif part.discard :
+					name = f'_discarded{index // 2}'
+				regex += f'(?P<{name}>{part.regex})'
+		return regex
+
+	def convert_values(self, strings) -> list :
+		'''
+		Applies our converters to the captured strings (in param order).
+		May raise ValueError.
+		'''
+		return [
+			param.converter(string)
+			for param, string in zip(self._params, strings)
+		]
+
+	def captures(self, values) -> dict :
+		'''
+		Returns the captures dict, given the result of convert_values().
+		'''
+		return {
+			param.name: value
+			for param, value in zip(self._params, values)
+			if not param.discard
+		}
+
+	def convert(self, strings) -> dict :
+		'''
+		Applies our converters to the captured strings (in param order),
+		and returns the captures dict. May raise ValueError.
+		'''
+		return self.captures(self.convert_values(strings))
 
 	def match(self, path) -> tuple :
 		'''
@@ -59,15 +214,25 @@ class Pattern:
 
 		Otherwise, raise ValueError
 		'''
-		match = re.match(self._regex, path)
+		end, captures = self.match_at(path, 0)
+		return path[:end], captures
+
+	def match_at(self, path, pos) -> tuple :
+		'''
+		Like match(), but matches path starting at index pos (without
+		slicing path), and returns the index where the match ends.
+		'''
+		if self.literal :
+			if not path.startswith(self.pattern, pos) :
+				raise ValueError()
+			return pos + len(self.pattern), {}
+
+		match = self._compiled.match(path, pos)
 		if not match :
 			raise ValueError()
 
 		return (
-			match.group(0),
+			match.end(),
 			# Note - may raise ValueError
-			{
-				name: converter(match.group(name))
-				for name, converter in self._types
-			}
+			self.convert(match.groups()),
 		)
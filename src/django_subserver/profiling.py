@@ -0,0 +1,217 @@
+'''
+On-demand profiling of a single subtree.
+
+Wrap any SubView (usually a Router) where it's installed:
+
+    REPORTS_PROFILE = profiled(ReportsRouter(), sample_rate=0.01)
+
+    class ApiRouter(Router):
+        routes = {
+            'reports/': REPORTS_PROFILE,
+        }
+
+Then (ie. from a staff-only view, or a shell) adjust REPORTS_PROFILE.sample_rate,
+read REPORTS_PROFILE.report(), or REPORTS_PROFILE.dump_stats(filename).
+'''
+
+import cProfile
+import io
+import pstats
+import tracemalloc
+from threading import Lock
+
+from .base import SubView, is_async_view
+
+# Held while any request is being profiled. cProfile (on Python 3.12+) and
+# tracemalloc are process-wide, so only one request (in any ProfiledView)
+# may be profiled at once.
+_profiling_lock = Lock()
+
+class ProfiledView(SubView):
+    '''
+    Calls view, running cProfile (and optionally tracemalloc) for a sampled
+    fraction of requests, and aggregating the results in memory.
+
+    Sampling is deterministic (every Nth request), so unsampled requests
+    only pay for a counter increment and comparison.
+
+    Only one request is profiled at a time (per process, across every
+    ProfiledView, so nested ProfiledViews work). If a request is sampled
+    while another is being profiled, or another profiler is active, it just
+    isn't profiled. Errors in profiling itself never affect the response.
+    '''
+    def __init__(self, view: SubView, sample_rate: float = 0.01, trace_memory: bool = False, memory_lines: int = 10):
+        self.view = view
+        self.trace_memory = trace_memory
+        self.memory_lines = memory_lines
+        self.sample_rate = sample_rate
+        self._count = 0
+        self.reset()
+
+    @property
+    def sample_rate(self) -> float :
+        return self._sample_rate
+    @sample_rate.setter
+    def sample_rate(self, rate: float):
+        '''
+        Fraction of requests to profile (0 to disable). Safe to change at any time.
+        '''
+        if not 0 <= rate <= 1 :
+            raise ValueError('sample_rate must be between 0 and 1')
+        self._sample_rate = rate
+        # Note - _count < inf is always True, so (with rate 0) every request takes the unsampled path
+        self._interval = round(1 / rate) if rate else float('inf')
+
+    def reset(self):
+        '''
+        Discards all collected stats.
+        '''
+        self.sampled = 0
+        self._stats = None
+        # Peak bytes allocated while handling sampled requests
+        self._peak_total = 0
+        self._peak_max = 0
+        # 'file:line' -> bytes allocated (and still alive) after sampled requests
+        self._retained = {}
+
+    def __call__(self, request, **kwargs):
+        self._count += 1
+        if self._count < self._interval :
+            return self.view(request, **kwargs)
+        self._count = 0
+        if not _profiling_lock.acquire(blocking=False) :
+            return self.view(request, **kwargs)
+        try :
+            session = self._start()
+            if session is None :
+                return self.view(request, **kwargs)
+            try :
+                return self.view(request, **kwargs)
+            finally :
+                self._stop(session)
+        finally :
+            _profiling_lock.release()
+
+    def _start(self):
+        '''
+        Returns (profiler, memory), or None if profiling couldn't start
+        (ie. another profiler is active).
+        '''
+        memory = None
+        try :
+            memory = self._start_memory()
+            profiler = cProfile.Profile()
+            profiler.enable()
+        except Exception :
+            self._stop_memory(memory)
+            return None
+        return profiler, memory
+
+    def _stop(self, session):
+        profiler, memory = session
+        try :
+            profiler.disable()
+            self._record(profiler, memory)
+        except Exception :
+            # Never let our bookkeeping fail the request
+            pass
+        finally :
+            self._stop_memory(memory)
+
+    def _stop_memory(self, memory):
+        '''
+        Stops tracemalloc, if we started it.
+        '''
+        if memory is not None and memory[0] and tracemalloc.is_tracing() :
+            tracemalloc.stop()
+
+    def _start_memory(self):
+        if not self.trace_memory :
+            return None
+        started = not tracemalloc.is_tracing()
+        if started :
+            tracemalloc.start()
+        if hasattr(tracemalloc, 'reset_peak') :
+            tracemalloc.reset_peak()
+        return started, tracemalloc.get_traced_memory()[0], tracemalloc.take_snapshot()
+
+    def _record(self, profiler, memory):
+        self.sampled += 1
+        if self._stats is None :
+            self._stats = pstats.Stats(profiler)
+        else :
+            self._stats.add(profiler)
+
+        if memory is None :
+            return
+        started, baseline, before = memory
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        after = tracemalloc.take_snapshot()
+        self._stop_memory(memory)
+        self._peak_total += peak
+        self._peak_max = max(self._peak_max, peak)
+        for stat in after.compare_to(before, 'lineno')[:self.memory_lines] :
+            frame = stat.traceback[0]
+            key = f'{frame.filename}:{frame.lineno}'
+            self._retained[key] = self._retained.get(key, 0) + stat.size_diff
+
+    def dump_stats(self, filename):
+        '''
+        Writes the aggregated profile in pstats format
+        (readable with pstats, snakeviz, etc.).
+        '''
+        if self._stats is None :
+            raise ValueError('No requests have been profiled')
+        self._stats.dump_stats(filename)
+
+    def report(self, sort: str = 'cumulative', limit: int = 30) -> str :
+        '''
+        Returns a text report of the aggregated profile (and memory stats).
+        '''
+        out = io.StringIO()
+        out.write(f'{self.sampled} sampled request(s) of {self.view!r} (sample_rate={self.sample_rate})\n')
+        if self._stats is None :
+            return out.getvalue()
+        stats = pstats.Stats(stream=out)
+        stats.add(self._stats)
+        stats.sort_stats(sort).print_stats(limit)
+        if self.trace_memory :
+            out.write(f'Peak memory per request: mean {self._peak_total // self.sampled} bytes, max {self._peak_max} bytes\n')
+            out.write('Memory retained after requests (by line):\n')
+            for key, size in sorted(self._retained.items(), key=lambda item: -item[1])[:self.memory_lines] :
+                out.write(f'  {size:>10} bytes  {key}\n')
+        return out.getvalue()
+
+class AsyncProfiledView(ProfiledView):
+    '''
+    ProfiledView for async views.
+
+    Note - while a sampled request is awaiting, other tasks on the same
+    event loop run too, and are included in the profile.
+    '''
+    async def __call__(self, request, **kwargs):
+        self._count += 1
+        if self._count < self._interval :
+            return await self.view(request, **kwargs)
+        self._count = 0
+        if not _profiling_lock.acquire(blocking=False) :
+            return await self.view(request, **kwargs)
+        try :
+            session = self._start()
+            if session is None :
+                return await self.view(request, **kwargs)
+            try :
+                return await self.view(request, **kwargs)
+            finally :
+                self._stop(session)
+        finally :
+            _profiling_lock.release()
+
+def profiled(view: SubView, **options) -> ProfiledView :
+    '''
+    Returns a ProfiledView (or AsyncProfiledView, if view is async)
+    wrapping view. See ProfiledView for options.
+    '''
+    if is_async_view(view) :
+        return AsyncProfiledView(view, **options)
+    return ProfiledView(view, **options)
@@ -0,0 +1,219 @@
+'''
+Note - this is an implementation detail of Router.
+'''
+
+import re
+from typing import Optional, Sequence, Tuple
+
+from .pattern import Pattern
+
+class _Node:
+    '''
+    A node in a trie of path segments.
+    '''
+    def __init__(self, head):
+        # Pattern matching a single path segment (None for the root node)
+        self.head = head
+        # segment key -> _Node (in order of first use)
+        self.children = {}
+        # position of the Pattern which ends at this node, if any
+        self.terminal = None
+
+    def positions(self):
+        '''
+        Positions of all Patterns below this node, in the order that our
+        regex will try them.
+        '''
+        for child in self.children.values() :
+            yield from child.positions()
+        if self.terminal is not None :
+            yield self.terminal
+
+def _segment_key(head):
+    return head.regex(''), tuple(param.converter for param in head._params)
+
+class _Matcher:
+    '''
+    A sequence of Patterns, compiled into a single regex.
+
+    Where possible, common leading segments are factored out (so the
+    regex is shaped like a trie of path segments), and the regex engine
+    only has to examine each segment of the path once. That is only
+    valid if the trie tries Patterns in declaration order, though.
+    If it wouldn't, we use a simple alternation of the whole Patterns.
+
+    Either way, the regex finds the first Pattern that matches.
+    '''
+    def __init__(self, entries):
+        # entries: [(index, Pattern)], in declaration order
+        self.entries = entries
+        self.first_index = entries[0][0]
+
+        root = self._build(factor=True)
+        positions = list(root.positions())
+        if positions != sorted(positions) :
+            root = self._build(factor=False)
+
+        # position -> group names of that Pattern's params
+        groups = {}
+        self.regex = re.compile(self._node_regex(root, [], groups, [0]))
+        # marker group number -> (position, param group numbers)
+        self.markers = {
+            self.regex.groupindex[f'_e{position}']: (
+                position,
+                [self.regex.groupindex[name] for name in names],
+            )
+            for position, names in groups.items()
+        }
+
+    def _build(self, factor):
+        root = _Node(None)
+        for position, (index, pattern) in enumerate(self.entries) :
+            node = root
+            rest = pattern
+            while rest is not None :
+                if node.terminal is not None :
+                    # A shorter Pattern was declared earlier, and will
+                    # always match first. This Pattern is unreachable.
+                    break
+                head, rest = rest.split_first_segment()
+                if factor and not head.multi_segment :
+                    key = _segment_key(head)
+                else :
+                    # Note - a multi-segment head may match different lengths,
+                    # and the regex engine tries every alternative after it
+                    # before trying a shorter match, so we can't share it.
+                    key = (position,)
+                child = node.children.get(key)
+                if child is None :
+                    child = node.children[key] = _Node(head)
+                node = child
+            else :
+                # If terminal is already set, this Pattern is a duplicate.
+                # If node has children, they were declared earlier, and
+                # will be tried first (which is correct).
+                if node.terminal is None :
+                    node.terminal = position
+        return root
+
+    def _node_regex(self, node, names, groups, counter):
+        alternatives = []
+        for child in node.children.values() :
+            counter[0] += 1
+            prefix = f'_g{counter[0]}_'
+            child_names = names + [f'{prefix}{index}' for index in range(len(child.head._params))]
+            alternatives.append(
+                child.head.regex(prefix)
+                + self._node_regex(child, child_names, groups, counter)
+            )
+        if node.terminal is not None :
+            groups[node.terminal] = names
+            alternatives.append(f'(?P<_e{node.terminal}>)')
+        if len(alternatives) == 1 :
+            return alternatives[0]
+        return '(?:' + '|'.join(alternatives) + ')'
+
+    def match(self, path, pos):
+        '''
+        Returns (index, end, captures) for the first Pattern matching
+        path at pos, or None.
+        '''
+        match = self.regex.match(path, pos)
+        if not match :
+            return None
+        position, group_numbers = self.markers[match.lastindex]
+        index, pattern = self.entries[position]
+        try :
+            return (
+                index,
+                match.end(),
+                pattern.convert([match.group(number) for number in group_numbers]),
+            )
+        except ValueError :
+            pass
+
+        # A converter rejected the match (ie. invalid date).
+        # This is rare, so we just fall back to trying the remaining
+        # Patterns one at a time.
+        for index, pattern in self.entries[position+1:] :
+            try :
+                end, captures = pattern.match_at(path, pos)
+            except ValueError :
+                continue
+            return index, end, captures
+        return None
+
+class RouteTable:
+    '''
+    Compiled form of a sequence of Patterns.
+
+    Patterns whose first path segment is completely literal are bucketed
+    in a dict, keyed on that segment. All other Patterns are grouped by
+    their literal prefix (the part before the first capturing param,
+    often ''). Each bucket/group is compiled into a single regex
+    (see _Matcher), so we only run the regexes that could possibly match.
+
+    match() returns the same result as trying each Pattern in order, and
+    returning the first one that matches (and whose converters succeed).
+    '''
+    def __init__(self, patterns: Sequence[Pattern]):
+        self._patterns = list(patterns)
+
+        fixed = {}
+        dynamic = {}
+        for index, pattern in enumerate(self._patterns) :
+            head, rest = pattern.split_first_segment()
+            if head.literal :
+                fixed.setdefault(head.pattern[:-1], []).append((index, pattern))
+            else :
+                dynamic.setdefault(head._parts[0], []).append((index, pattern))
+
+        # first segment -> _Matcher
+        self._fixed = {
+            segment: _Matcher(entries)
+            for segment, entries in fixed.items()
+        }
+        # literal prefix -> _Matcher
+        self._dynamic = {
+            prefix: _Matcher(entries)
+            for prefix, entries in dynamic.items()
+        }
+        self._prefix_lengths = sorted({len(prefix) for prefix in self._dynamic})
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def match(self, path: str, pos: int = 0) -> Optional[Tuple[int, int, dict]] :
+        '''
+        Matches path, starting at index pos (ie. sub_path is path[pos:]).
+
+        Returns (index, end, captures) for the first matching Pattern, 
+        or None. end is the index in path where the match ends.
+        '''
+        best = None
+        limit = len(self._patterns)
+
+        slash = path.find('/', pos)
+        if slash == -1 :
+            # Every Pattern ends with '/'
+            return None
+
+        if self._fixed :
+            # Note - dict keys are the only strings we allocate while matching
+            matcher = self._fixed.get(path[pos:slash])
+            if matcher :
+                best = matcher.match(path, pos)
+                if best :
+                    limit = best[0]
+
+        for length in self._prefix_lengths :
+            if pos + length > slash :
+                break
+            matcher = self._dynamic.get(path[pos:pos+length] if length else '')
+            if matcher is None or matcher.first_index >= limit :
+                continue
+            result = matcher.match(path, pos)
+            if result and result[0] < limit :
+                best = result
+                limit = result[0]
+        return best
@@ -1,9 +1,17 @@
-from django.http import HttpResponse, Http404
+from asgiref.sync import async_to_sync, sync_to_async
+from django.http import HttpRequest, HttpResponse, Http404
+from functools import lru_cache
 from importlib import import_module
-from typing import Any, Mapping, Optional, Sequence, Union
+from threading import RLock
+from time import perf_counter
+from typing import Any, Callable, Mapping, MutableMapping, Optional, Sequence, Union
 
-from .base import SubRequest, SubView
+from . import tracing
+from .base import NOT_FOUND, SubRequest, SubView, is_async_view
+from .loading import AsyncLoader, Loader, get_loader
+from .metrics import RouteMetrics
 from .pattern import Pattern
+from .route_table import RouteTable
 
 ViewSpec = Union[SubView, str]
 def _get_view(owning_class, view_spec):
@@ -30,6 +38,9 @@ def _get_view(owning_class, view_spec):
     In that case, root_router can't just say:
         'admin/': admin_router()
     because admin_router isn't defined yet.
+
+    String ViewSpecs are "interned": every ViewSpec that refers to the same
+    class resolves to the same (shared) instance.
     '''
     if not isinstance(view_spec, str) :
         return view_spec
@@ -40,9 +51,49 @@ def _get_view(owning_class, view_spec):
         module = owning_class.__module__
         cls = view_spec
 
-    module = import_module(module)
-    cls = getattr(module, cls)
-    return cls()
+    key = (module, cls)
+    with _instances_lock :
+        try :
+            return _instances[key]
+        except KeyError :
+            pass
+        module = import_module(module)
+        cls = getattr(module, cls)
+        view = _instances[key] = cls()
+        return view
+
+# (module name, class name) -> instance
+_instances = {}
+# Reentrant, since instantiating a view may resolve other ViewSpecs
+_instances_lock = RLock()
+
+class _LazyView:
+    '''
+    Placeholder for a string ViewSpec, which hasn't been resolved yet.
+    See Router.warm().
+    '''
+    def __init__(self, owning_class, view_spec):
+        self.owning_class = owning_class
+        self.view_spec = view_spec
+        self.view = None
+
+    def __repr__(self):
+        return f'<lazy view {self.view_spec!r}>'
+
+    def resolve(self):
+        if self.view is None :
+            self.view = _get_view(self.owning_class, self.view_spec)
+        return self.view
+
+def _lazy_view(owning_class, view_spec):
+    if isinstance(view_spec, str) :
+        return _LazyView(owning_class, view_spec)
+    return view_spec
+
+def _resolve(view):
+    if isinstance(view, _LazyView) :
+        return view.resolve()
+    return view
 
 class Router(SubView):
     '''
@@ -54,12 +105,31 @@ class Router(SubView):
         mapping of (sub_path) patterns to views
     - cascade
         list of views to try
-        if any of them do _not_ raise Http404, we'll return whatever they do
+        if any of them do _not_ raise Http404 (or return NOT_FOUND), 
+        we'll return whatever they do
     - path_view
         called when sub_path is non-empty, and none of the above match/return a response
+    - route_cache_size
+        if non-zero, we keep an LRU cache (of this size) of sub_path -> 
+        matched route and converted captures, so repeated paths skip 
+        pattern matching and converters entirely. See route_cache_info().
+    - return_not_found
+        if True, we return NOT_FOUND (rather than raising Http404) when 
+        nothing matches. Useful for Routers which are cascaded to.
+    - loaders
+        mapping of names to batch loading functions (keys -> objects), 
+        for use in prepare(). See loader() and loading.py.
+    - metrics
+        a RouteMetrics instance to record request counts and latencies to
+        (usually set on a base class shared by all your Routers). 
+        If None (the default), there is no per-request overhead at all.
 
     Subclasses may also want to override prepare and/or dispatch.
 
+    String ViewSpecs (in `routes` and `cascade`) are resolved lazily, the
+    first time a request reaches them. Call warm() to resolve them all
+    up front (ie. before your server forks worker processes).
+
     Note that `routes` and `cascade` may also contain falsey values. 
     Those will be ignored. 
     This makes it easier to perform environment-dependent routing
@@ -69,6 +139,10 @@ class Router(SubView):
     routes: Mapping[str, Optional[ViewSpec]] = dict()
     cascade: Sequence[Optional[ViewSpec]] = []
     path_view: Optional[SubView] = None
+    route_cache_size: int = 0
+    return_not_found: bool = False
+    loaders: Mapping[str, Callable] = dict()
+    metrics: Optional[RouteMetrics] = None
 
     def prepare(self, request: SubRequest, **captured_params:Any) -> Optional[HttpResponse] :
         '''
@@ -90,39 +164,498 @@ class Router(SubView):
         '''
         return view(request)
 
+    def loader(self, request: SubRequest, name: str) -> Loader :
+        '''
+        Returns the request's Loader for loaders[name]. 
+
+        Loaders are shared by every SubRequest of the same request (and
+        requests derived from it via call_internal()), and by every Router
+        declaring the same function, so sibling and repeated lookups are
+        batched and cached.
+        '''
+        return get_loader(request, self.loaders[name], self._loader_class)
+
     # Not to be overriden by sub classes
+    _loader_class = Loader
+    _tree_compiled = False
+    _warmed = False
+    _patterns = {}
+    def __init_subclass__(cls, **kwargs):
+        '''
+        Parse (and validate) our route patterns when the class is defined,
+        rather than every time it's instantiated.
+        '''
+        super().__init_subclass__(**kwargs)
+        cls._patterns = {
+            pattern: Pattern(pattern)
+            for pattern, view_spec in cls.routes.items()
+            if view_spec
+        }
     def __init__(self):
+        patterns = self._patterns
         self.routes = [
-            # TODO - implement Pattern
-            (Pattern(pattern), _get_view(self.__class__, view_spec))
+            (
+                patterns.get(pattern) or Pattern(pattern),
+                _lazy_view(self.__class__, view_spec),
+            )
             for pattern, view_spec in self.__class__.routes.items()
             if view_spec
         ]
         self.cascade_to = [
-            _get_view(self.__class__, view_spec)
+            _lazy_view(self.__class__, view_spec)
             for view_spec in self.__class__.cascade
             if view_spec
         ]
+        self._compile_routes()
+
+    def warm(self) -> 'Router' :
+        '''
+        Resolves (imports and instantiates) every string ViewSpec in the
+        tree below us. Otherwise, that happens on the first request to 
+        reach each one. Returns self.
+
+        Call this at startup if you want import errors to surface early,
+        or (with a pre-fork server) in the parent process, so that
+        workers share the resolved tree. Once warm, there is no overhead
+        from lazy resolution.
+        '''
+        if self._warmed :
+            return self
+        self._warmed = True
+
+        self.routes = [(pattern, _resolve(view)) for pattern, view in self.routes]
+        self.cascade_to = [_resolve(view) for view in self.cascade_to]
+        self._compile_routes()
+        for pattern, view in self.routes :
+            if isinstance(view, Router) :
+                view.warm()
+        for view in self.cascade_to :
+            if isinstance(view, Router) :
+                view.warm()
+        return self
+
+    def compile_tree(self) -> 'Router' :
+        '''
+        Optional optimization. Call once, at startup, on your root Router.
+        Returns self, so you can write:
+            sub_view_urls(root_router().compile_tree())
+
+        Walks the tree of Routers below us. Wherever a route leads to a
+        "pass-through" Router (one which doesn't override prepare, dispatch,
+        __call__ or _route), that Router's routes are merged into our own
+        (as multi-segment patterns), so requests jump straight to the first
+        view that does real work.
+
+        The behaviour is unchanged. The pass-through Router is kept as a
+        fallback (after its merged routes), so its root_view, cascade,
+        and path_view still work as before.
+        '''
+        if self._tree_compiled :
+            return self
+        self._tree_compiled = True
+        self.warm()
+
+        for view in self.cascade_to :
+            if isinstance(view, Router) :
+                view.compile_tree()
+
+        routes = []
+        for pattern, view in self.routes :
+            if isinstance(view, Router) :
+                view.compile_tree()
+                # Note - a multi-segment param (ie. <path:p>) in our pattern
+                # would take a different match once followed by the child's
+                # pattern, so we can't merge those.
+                if not pattern.multi_segment and _is_pass_through(view, AsyncRouter if isinstance(self, AsyncRouter) else Router) :
+                    for child_pattern, child_view in view.routes :
+                        routes.append((pattern.followed_by(child_pattern), child_view))
+            routes.append((pattern, view))
+        self.routes = routes
+        self._compile_routes()
+        return self
+
+    def explain(self, path: Union[str, SubRequest], method: str = 'GET') -> 'Explanation' :
+        '''
+        Debugging aid. Returns an Explanation of how we'd resolve path 
+        (which must start with '/', as if we were mounted at '/'), or the
+        given SubRequest.
+        print() it for a readable report.
+
+        Walks the tree, using the same route lookup as real requests
+        (but without using or affecting the route cache),
+        and records each step (with timings): the route matched at each
+        level, each pattern tried before it (individually timed, so you 
+        can find expensive early patterns), cascade attempts, and the view
+        that would handle the request.
+
+        No views are called. That includes prepare() and dispatch() of
+        Routers in the tree, so the explanation assumes they don't return
+        early. Non-Router cascade views aren't called either, so we can't
+        know if they'd return NOT_FOUND (see Explanation.certain).
+        '''
+        from .explain import explain
+        return explain(self, path, method)
+
+    def call_internal(self, parent_request: Union[HttpRequest, SubRequest], path: str, method: str = 'GET', fragment_cache: Optional[MutableMapping] = None, mount_path: str = '/') -> HttpResponse :
+        '''
+        Resolves path (relative to mount_path, where we're mounted, and
+        optionally including a query string) through this tree, and returns
+        the response. Useful for composing pages out of fragments served
+        by other routes, without an HTTP round trip.
+
+        The request is derived from parent_request (same user, session, 
+        cookies, headers, etc.), but has the given method and an empty body
+        (see internal.derived_request). Django's URL resolver and middleware
+        are not involved, but our own prepare() and dispatch() are, so auth
+        done there still applies.
+
+        Raises Http404 if nothing handles the path. TemplateResponses are
+        rendered (as Django's handler would), before being cached/returned.
+
+        fragment_cache:
+            optional mapping to cache GET/HEAD responses in, by method and 
+            full path. Usually per-request, so that repeated fragments are 
+            only rendered once. IE:
+                router.call_internal(request, 'sidebar/', 
+                    fragment_cache=request_memo(request).setdefault('fragments', {}))
+            Note - cached responses are returned as-is (not copied).
+        '''
+        from .internal import derived_request, fragment_key, needs_render
+        request = derived_request(parent_request, path, method, mount_path)
+        key = None if fragment_cache is None else fragment_key(request)
+        if key is not None :
+            try :
+                return fragment_cache[key]
+            except KeyError :
+                pass
+        response = self(request)
+        if response is NOT_FOUND :
+            raise Http404()
+        if needs_render(response) :
+            response = response.render()
+        if key is not None :
+            fragment_cache[key] = response
+        return response
+
+    def route_cache_info(self):
+        '''
+        Returns hits, misses, maxsize and currsize of our route cache
+        (as a functools._CacheInfo), or None if route_cache_size is 0.
+        '''
+        if self._route_cache is None :
+            return None
+        return self._route_cache.cache_info()
+
+    def _adapt_view(self, view):
+        '''
+        Returns a version of view that we can call directly.
+        Async views (ie. AsyncRouters) are wrapped with async_to_sync.
+        '''
+        if is_async_view(view) :
+            return async_to_sync(view)
+        return view
+
+    def _view_caller(self, view):
+        '''
+        Like _adapt_view, but view may be a _LazyView.
+        In that case, we can't tell whether it's async until it's resolved.
+        '''
+        if not isinstance(view, _LazyView) :
+            return self._adapt_view(view)
+        adapted = None
+        def call_lazy_view(*args, **kwargs):
+            nonlocal adapted
+            if adapted is None :
+                adapted = self._adapt_view(view.resolve())
+            return adapted(*args, **kwargs)
+        return call_lazy_view
+
+    def _compile_routes(self):
+        cls = self.__class__
+        self._root_view = cls.root_view and self._adapt_view(cls.root_view)
+        self._path_view = cls.path_view and self._adapt_view(cls.path_view)
+        self._route_views = [self._view_caller(view) for pattern, view in self.routes]
+        self._cascade_views = [self._view_caller(view) for view in self.cascade_to]
+        self._route_table = RouteTable([pattern for pattern, view in self.routes])
+        self._match_route = self._route_table.match
+        self._route_cache = None
+        if self.route_cache_size :
+            # Note - lru_cache is thread safe, and evicts least recently used
+            # entries, so it stays bounded even when bots scan random urls.
+            # Cached captures are shared between requests; we always pass
+            # them as **kwargs, so views get their own dict.
+            self._route_cache = lru_cache(self.route_cache_size)(self._route_table.match)
+            self._match_route = self._match_cached_route
+        if self.metrics :
+            self._instrument()
+
+    def _instrument(self):
+        '''
+        Wraps each of our (adapted) views, and _route itself, so that they
+        record to self.metrics. Only called if metrics are enabled, so
+        there's no cost otherwise.
+        '''
+        cls = self.__class__
+        name = self._router_name()
+        meter = self._metered
+        if self._root_view :
+            self._root_view = meter(self._root_view, name, 'root_view')
+        if self._path_view :
+            self._path_view = meter(self._path_view, name, 'path_view')
+        self._route_views = [
+            meter(view, name, pattern.pattern)
+            for view, (pattern, unused) in zip(self._route_views, self.routes)
+        ]
+        self._cascade_views = [
+            meter(view, name, f'cascade[{index}]')
+            for index, view in enumerate(self._cascade_views)
+        ]
+        # Note - shadows the _route method, for this instance only
+        self._route = meter(cls._route.__get__(self, cls), name, None)
+
+    def _metered(self, view, router_name, label):
+        record = self.metrics.record
+        def metered_view(*args, **kwargs):
+            start = perf_counter()
+            try :
+                response = view(*args, **kwargs)
+            except Http404 :
+                record(router_name, label, perf_counter() - start, True)
+                raise
+            record(router_name, label, perf_counter() - start, response is NOT_FOUND)
+            return response
+        return metered_view
+
+    def _match_cached_route(self, path, pos):
+        # Keyed on sub_path, since the same sub_path may occur at different offsets
+        resolved = self._route_cache(path[pos:])
+        if resolved :
+            index, end, captures = resolved
+            return index, pos + end, captures
+        return None
+
+    def _router_name(self):
+        cls = self.__class__
+        return f'{cls.__module__}.{cls.__qualname__}'
+
     def __call__(self, request:SubRequest, **captured_params:[Any]) -> HttpResponse :
+        if tracing.tracer :
+            return self._traced_call(request, captured_params)
         possible_response = self.prepare(request, **captured_params)
         if possible_response :
             return possible_response
         return self.dispatch(request, self._route)
     def _route(self, request):
-        if not request.sub_path and self.root_view :
-            return self.__class__.root_view(request)
-        for pattern, view in self.routes :
+        if tracing.tracer :
+            return self._traced_route(request)
+        path = request._request.path
+        pos = request._parent_path_length
+        if pos == len(path) and self._root_view :
+            return self._root_view(request)
+        resolved = self._match_route(path, pos)
+        if resolved :
+            index, end, captures = resolved
+            return self._route_views[index](request._advance(end), **captures)
+        for view in self._cascade_views :
             try :
-                match, captures = pattern.match(request.sub_path)
-            except ValueError :
+                response = view(request)
+            except Http404 :
                 continue
-            else :
-                return view(request.after(match), **captures)
-        for view in self.cascade_to :
+            if response is not NOT_FOUND :
+                return response
+        if pos < len(path) and self._path_view :
+            return self._path_view(request)
+        if self.return_not_found :
+            return NOT_FOUND
+        raise Http404()
+
+    def _traced_call(self, request, captured_params):
+        '''
+        Equivalent to __call__, but emits spans (see tracing module).
+        '''
+        span = tracing.tracer.span
+        router = self._router_name()
+        params = tuple(captured_params)
+        with span('router', dict(router=router, params=params)) :
+            with span('prepare', dict(router=router, params=params)) :
+                possible_response = self.prepare(request, **captured_params)
+            if possible_response :
+                return possible_response
+            with span('dispatch', dict(router=router)) :
+                return self.dispatch(request, self._route)
+    def _traced_route(self, request):
+        '''
+        Equivalent to _route, but emits spans (see tracing module).
+        Keep in sync with _route.
+        '''
+        span = tracing.tracer.span
+        router = self._router_name()
+        path = request._request.path
+        pos = request._parent_path_length
+        if pos == len(path) and self._root_view :
+            with span('root_view', dict(router=router)) :
+                return self._root_view(request)
+        resolved = self._match_route(path, pos)
+        if resolved :
+            index, end, captures = resolved
+            attributes = dict(router=router, pattern=self.routes[index][0].pattern, params=tuple(captures))
+            with span('route', attributes) :
+                return self._route_views[index](request._advance(end), **captures)
+        for index, view in enumerate(self._cascade_views) :
+            with span('cascade', dict(router=router, index=index)) :
+                try :
+                    response = view(request)
+                except Http404 :
+                    continue
+            if response is not NOT_FOUND :
+                return response
+        if pos < len(path) and self._path_view :
+            with span('path_view', dict(router=router)) :
+                return self._path_view(request)
+        if self.return_not_found :
+            return NOT_FOUND
+        raise Http404()
+
+class AsyncRouter(Router):
+    '''
+    Router for use under ASGI.
+
+    prepare, dispatch and __call__ are coroutine functions. Subclasses
+    overriding prepare or dispatch must also define them with "async def".
+
+    Any sync views (ie. plain Routers, or sync view functions) we route to
+    are wrapped with sync_to_async, so a mixed tree only switches to a
+    thread at the point where it reaches sync code.
+
+    Note - mount an AsyncRouter via sub_view_urls, and Django will
+    see an async view.
+    '''
+    async def prepare(self, request: SubRequest, **captured_params:Any) -> Optional[HttpResponse] :
+        pass
+
+    async def dispatch(self, request:SubRequest, view:SubView) -> HttpResponse :
+        return await view(request)
+
+    _loader_class = AsyncLoader
+
+    async def call_internal(self, parent_request: Union[HttpRequest, SubRequest], path: str, method: str = 'GET', fragment_cache: Optional[MutableMapping] = None, mount_path: str = '/') -> HttpResponse :
+        from .internal import derived_request, fragment_key, needs_render
+        request = derived_request(parent_request, path, method, mount_path)
+        key = None if fragment_cache is None else fragment_key(request)
+        if key is not None :
+            try :
+                return fragment_cache[key]
+            except KeyError :
+                pass
+        response = await self(request)
+        if response is NOT_FOUND :
+            raise Http404()
+        if needs_render(response) :
+            response = await sync_to_async(response.render)()
+        if key is not None :
+            fragment_cache[key] = response
+        return response
+
+    def _adapt_view(self, view):
+        if is_async_view(view) :
+            return view
+        return sync_to_async(view)
+
+    def _metered(self, view, router_name, label):
+        record = self.metrics.record
+        async def metered_view(*args, **kwargs):
+            start = perf_counter()
             try :
-                return view(request)
+                response = await view(*args, **kwargs)
+            except Http404 :
+                record(router_name, label, perf_counter() - start, True)
+                raise
+            record(router_name, label, perf_counter() - start, response is NOT_FOUND)
+            return response
+        return metered_view
+
+    async def __call__(self, request:SubRequest, **captured_params:[Any]) -> HttpResponse :
+        if tracing.tracer :
+            return await self._traced_call(request, captured_params)
+        possible_response = await self.prepare(request, **captured_params)
+        if possible_response :
+            return possible_response
+        return await self.dispatch(request, self._route)
+    async def _route(self, request):
+        if tracing.tracer :
+            return await self._traced_route(request)
+        path = request._request.path
+        pos = request._parent_path_length
+        if pos == len(path) and self._root_view :
+            return await self._root_view(request)
+        resolved = self._match_route(path, pos)
+        if resolved :
+            index, end, captures = resolved
+            return await self._route_views[index](request._advance(end), **captures)
+        for view in self._cascade_views :
+            try :
+                response = await view(request)
             except Http404 :
                 continue
-        if request.sub_path and self.path_view :
-            return self.__class__.path_view(request)
+            if response is not NOT_FOUND :
+                return response
+        if pos < len(path) and self._path_view :
+            return await self._path_view(request)
+        if self.return_not_found :
+            return NOT_FOUND
+        raise Http404()
+
+    async def _traced_call(self, request, captured_params):
+        span = tracing.tracer.span
+        router = self._router_name()
+        params = tuple(captured_params)
+        with span('router', dict(router=router, params=params)) :
+            with span('prepare', dict(router=router, params=params)) :
+                possible_response = await self.prepare(request, **captured_params)
+            if possible_response :
+                return possible_response
+            with span('dispatch', dict(router=router)) :
+                return await self.dispatch(request, self._route)
+    async def _traced_route(self, request):
+        span = tracing.tracer.span
+        router = self._router_name()
+        path = request._request.path
+        pos = request._parent_path_length
+        if pos == len(path) and self._root_view :
+            with span('root_view', dict(router=router)) :
+                return await self._root_view(request)
+        resolved = self._match_route(path, pos)
+        if resolved :
+            index, end, captures = resolved
+            attributes = dict(router=router, pattern=self.routes[index][0].pattern, params=tuple(captures))
+            with span('route', attributes) :
+                return await self._route_views[index](request._advance(end), **captures)
+        for index, view in enumerate(self._cascade_views) :
+            with span('cascade', dict(router=router, index=index)) :
+                try :
+                    response = await view(request)
+                except Http404 :
+                    continue
+            if response is not NOT_FOUND :
+                return response
+        if pos < len(path) and self._path_view :
+            with span('path_view', dict(router=router)) :
+                return await self._path_view(request)
+        if self.return_not_found :
+            return NOT_FOUND
         raise Http404()
+
+
+def _is_pass_through(router, base):
+    '''
+    Returns True if routing to router is equivalent to matching 
+    one of its routes directly (ie. it ignores captured_params, and 
+    doesn't do anything before/after delegating to the matched view).
+
+    base is Router or AsyncRouter (whichever the parent is).
+    '''
+    cls = router.__class__
+    return all(
+        getattr(cls, name) is getattr(base, name)
+        for name in ('prepare', 'dispatch', '__call__', '_route')
+    )
@@ -0,0 +1,153 @@
+'''
+Hooks for tracing requests through a tree of Routers (and module_views).
+
+Install a tracer with set_tracer(). Until you do, each hook point costs
+a single attribute check.
+
+Spans emitted:
+- "router": a whole Router.__call__ (attributes: router, params)
+- "prepare": Router.prepare (attributes: router, params)
+- "dispatch": Router.dispatch, including routing (attributes: router)
+- "route": a matched route's view (attributes: router, pattern, params)
+- "cascade": one cascade attempt (attributes: router, index)
+- "root_view", "path_view": (attributes: router)
+- "module_view": a module_view handler (attributes: module, method)
+
+router is the Router's class name (module.qualname), pattern is the
+matched routes pattern, and params are the names (not values) of the
+captured parameters.
+
+Note - after compile_tree(), routes merged from pass-through Routers
+appear as a single "route" span of the parent Router.
+
+Note - this module is independent of the rest of django_subserver.
+'''
+
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from time import perf_counter
+from typing import ContextManager, Optional
+
+try :
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError :
+    from asyncio import iscoroutinefunction
+    markcoroutinefunction = None
+
+class Tracer(ABC):
+    '''
+    Interface for tracers.
+    '''
+    @abstractmethod
+    def span(self, name: str, attributes: dict) -> ContextManager :
+        '''
+        Returns a context manager, which is entered while the span is active.
+        Spans nest (within a request), so implementations may want to track
+        the current span via a contextvar.
+        '''
+
+# The installed Tracer, or None
+tracer: Optional[Tracer] = None
+
+def set_tracer(new_tracer: Optional[Tracer]):
+    '''
+    Installs a Tracer globally (or uninstalls, if None).
+    '''
+    global tracer
+    tracer = new_tracer
+
+# Per-request list of (name, attributes, seconds), while ServerTimingMiddleware is active
+_timings = ContextVar('django_subserver_timings', default=None)
+
+class _TimingSpan:
+    __slots__ = ('timings', 'name', 'attributes', 'start')
+    def __init__(self, timings, name, attributes):
+        self.timings = timings
+        self.name = name
+        self.attributes = attributes
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+    def __exit__(self, *exc_info):
+        self.timings.append((self.name, self.attributes, perf_counter() - self.start))
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        pass
+_no_span = _NoSpan()
+
+class ServerTimingTracer(Tracer):
+    '''
+    Records the duration of each span, so that ServerTimingMiddleware
+    can report them in a Server-Timing header.
+
+    Install both:
+        set_tracer(ServerTimingTracer())
+    and (in settings.MIDDLEWARE):
+        'django_subserver.tracing.ServerTimingMiddleware'
+    '''
+    def span(self, name, attributes):
+        timings = _timings.get()
+        if timings is None :
+            return _no_span
+        return _TimingSpan(timings, name, attributes)
+
+def server_timing(timings) -> str :
+    '''
+    Formats (name, attributes, seconds) tuples as a Server-Timing header value.
+    '''
+    entries = []
+    for name, attributes, seconds in timings :
+        description = ' '.join(
+            str(attributes[key])
+            for key in ('router', 'module', 'pattern', 'index', 'method')
+            if key in attributes
+        )
+        description = description.replace('\\', '\\\\').replace('"', '\\"')
+        entries.append(f'{name};dur={seconds*1000:.3f};desc="{description}"')
+    return ', '.join(entries)
+
+class ServerTimingMiddleware:
+    '''
+    Adds a Server-Timing header, listing the spans recorded (by
+    ServerTimingTracer) while handling the request.
+
+    Note - Server-Timing is visible to clients (ie. in browser dev tools),
+    and reveals some of your url structure. You may only want to install
+    this in development, or for staff users.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async and markcoroutinefunction :
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async :
+            return self._async_call(request)
+        timings = []
+        token = _timings.set(timings)
+        try :
+            response = self.get_response(request)
+        finally :
+            _timings.reset(token)
+        return self._add_header(response, timings)
+
+    async def _async_call(self, request):
+        timings = []
+        token = _timings.set(timings)
+        try :
+            response = await self.get_response(request)
+        finally :
+            _timings.reset(token)
+        return self._add_header(response, timings)
+
+    def _add_header(self, response, timings):
+        if timings :
+            response['Server-Timing'] = server_timing(timings)
+        return response
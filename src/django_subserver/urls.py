@@ -1,7 +1,8 @@
 from django import urls
+from django.http import Http404
 from typing import Any, Mapping, Optional, Sequence
 
-from .base import SubView, SubRequest
+from .base import NOT_FOUND, SubView, SubRequest, is_async_view
 
 def sub_view_urls(sub_view:SubView) -> Sequence[urls.URLPattern]:
     '''
@@ -29,23 +30,44 @@ def sub_view_urls(sub_view:SubView) -> Sequence[urls.URLPattern]:
     However, it was actually broken, so we switched to re_path.
     For backward compatibility, we're not changing our signature.
     We could, however, _add_ a simpler sub_view_path(SubView)->URLPattern function to this module.
+
+    If the SubView returns NOT_FOUND, we raise Http404.
+
+    If the SubView is async (ie. an AsyncRouter), the view we install
+    is also async, so Django can call it without switching threads.
     '''
     def view(request, sub_path='', **other_url_kwargs):
-        sub_request = SubRequest(request)
+        response = sub_view(_sub_request(request, sub_path), **other_url_kwargs)
+        if response is NOT_FOUND :
+            raise Http404()
+        return response
 
-        path = request.path
-        handled = path[:len(path)-len(sub_path)]
+    async def async_view(request, sub_path='', **other_url_kwargs):
+        response = await sub_view(_sub_request(request, sub_path), **other_url_kwargs)
+        if response is NOT_FOUND :
+            raise Http404()
+        return response
 
-        if not handled.endswith('/') :
-            raise ValueError(f'Invalid parent path: "{handled}". Any prefix you include() sub_view_urls() underneath MUST end in "/".')
-
-        # handled startswith '/', but that '/' is already part of sub_request.parent_path, not sub_request.sub_path
-        to_advance = handled[1:]
-        if to_advance :
-            sub_request = sub_request.after(to_advance)
-        return sub_view(sub_request, **other_url_kwargs)
+    installed = async_view if is_async_view(sub_view) else view
+    # Lets tools (ie. the subserver_explain management command) find the SubView
+    installed.sub_view = sub_view
 
     return [
         # Match anything, including newlines (which might be encoded in URL as %0A)
-        urls.re_path(r'^(?P<sub_path>[\s\S]*)$', view),
+        urls.re_path(r'^(?P<sub_path>[\s\S]*)$', installed),
     ]
+
+def _sub_request(request, sub_path):
+    sub_request = SubRequest(request)
+
+    path = request.path
+    handled = path[:len(path)-len(sub_path)]
+
+    if not handled.endswith('/') :
+        raise ValueError(f'Invalid parent path: "{handled}". Any prefix you include() sub_view_urls() underneath MUST end in "/".')
+
+    # handled startswith '/', but that '/' is already part of sub_request.parent_path, not sub_request.sub_path
+    to_advance = handled[1:]
+    if to_advance :
+        sub_request = sub_request.after(to_advance)
+    return sub_request
@@ -7,11 +7,19 @@ from django import urls
 from django.http import Http404, HttpResponse, JsonResponse
 from django.test import Client, RequestFactory
 from django import urls
-from django_subserver import Router, SubRequest, sub_view_urls
+from django_subserver import tracing
+from django_subserver import NOT_FOUND, AsyncRouter, Router, RouteMetrics, SubRequest, sub_view_urls
 from django_subserver.base import SubView
-from django_subserver.pattern import Pattern
+from django_subserver.caching import cached
+from django_subserver.pattern import Pattern, register_converter
+from datetime import date
+import asyncio
+import contextlib
 import json
+import pstats
+import tempfile
 import unittest
+import unittest.mock
 
 def home_page(request):
     return HttpResponse('HOME', content_type='text/plain')
@@ -22,12 +30,50 @@ def echoing_sub_view(sub_request, **kwargs):
         sub_path=sub_request.sub_path,
         kwargs=kwargs,
     ))
+class ExplainedRouter(Router):
+    routes = {
+        'a/<int:x>/': echoing_sub_view,
+    }
+cached_calls = []
+def cached_me(sr):
+    cached_calls.append(sr.path)
+    return HttpResponse(f'hello {sr.session.get("name", "anonymous")}')
+def cached_login(sr):
+    sr.session['name'] = sr.GET['name']
+    return HttpResponse('ok')
+def cached_form(sr):
+    from django.middleware.csrf import get_token
+    cached_calls.append(sr.path)
+    return HttpResponse(f'token {get_token(sr)}')
+def cached_public(sr):
+    cached_calls.append(sr.path)
+    return HttpResponse('public')
+class CachedRouter(Router):
+    routes = {
+        'me/': cached_me,
+        'login/': cached_login,
+        'form/': cached_form,
+        'public/': cached_public,
+    }
+CACHED_TREE = cached(CachedRouter(), key_prefix='client')
 urlpatterns = [
     urls.path('', home_page),
+    urls.path('cached/', urls.include(sub_view_urls(CACHED_TREE))),
+    urls.path('<int:y>/router/', urls.include(sub_view_urls(ExplainedRouter()))),
     urls.path('no_trailing_slash', urls.include(sub_view_urls(echoing_sub_view))),
     urls.path('echoing_sub_view/', urls.include(sub_view_urls(echoing_sub_view))),
     urls.path('<int:x>/echoing_sub_view/', urls.include(sub_view_urls(echoing_sub_view))),
 ]
+def template_settings(**templates):
+    '''
+    Returns override_settings() for a template engine with templates
+    (name -> source).
+    '''
+    from django.test import override_settings
+    return override_settings(TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {'loaders': [('django.template.loaders.locmem.Loader', templates)]},
+    }])
 def get_json_data(url):
     c = Client()
     r = c.get(url)
@@ -155,6 +201,8 @@ class TestBasic(unittest.TestCase):
             sr.after('foo')
         sr = sr.after('foo/bar/')
         self.assertEqual(sr.sub_path, 'baz')
+        # computed once, then reused
+        self.assertIs(sr.sub_path, sr.sub_path)
         self.assertEqual(sr.parent_path+sr.sub_path, r.path)
         with self.assertRaises(ValueError):
             sr.after('baz')
@@ -170,6 +218,26 @@ class TestBasic(unittest.TestCase):
             sr2.bar
         self.assertEqual(sr.bar, 4)
 
+    def test_sub_request_copy(self):
+        import copy
+        r = RequestFactory().get('/foo/bar/')
+        sr = SubRequest(r).after('foo/')
+        sr.sub_path
+        sr.foo = 5
+        sr2 = copy.copy(sr)
+        self.assertIs(sr2.request, r)
+        self.assertEqual((sr2.parent_path, sr2.sub_path), ('/foo/', 'bar/'))
+        sr2.foo = 6
+        self.assertEqual(sr.foo, 5)
+
+        sr.items = [1]
+        sr3 = copy.deepcopy(sr)
+        self.assertIsNot(sr3.request, r)
+        self.assertEqual(sr3.request.path, '/foo/bar/')
+        self.assertEqual((sr3.parent_path, sr3.sub_path), ('/foo/', 'bar/'))
+        sr3.items.append(2)
+        self.assertEqual(sr.items, [1])
+
 class TestPattern(unittest.TestCase):
     def test_format_errors(self):
         # should not raise
@@ -242,6 +310,41 @@ class TestPattern(unittest.TestCase):
         self.assertEqual(match, 'foobar/')
         self.assertEqual(captures, dict(x='foobar'))
 
+    def test_builtin_converters(self):
+        from uuid import UUID
+        token = '12345678-1234-5678-1234-567812345678'
+        self.assertEqual(
+            Pattern('<uuid:u>/').match(token + '/x'),
+            (token + '/', dict(u=UUID(token))),
+        )
+        with self.assertRaises(ValueError):
+            Pattern('<uuid:u>/').match('1234/')
+        self.assertEqual(
+            Pattern('<slug:s>/').match('a-slug_1/x'),
+            ('a-slug_1/', dict(s='a-slug_1')),
+        )
+        with self.assertRaises(ValueError):
+            Pattern('<slug:s>/').match('a.b/')
+        self.assertEqual(
+            Pattern('files/<path:p>/').match('files/a/b/c'),
+            ('files/a/b/', dict(p='a/b')),
+        )
+
+    def test_register_converter(self):
+        register_converter('upper', r'[A-Z]+', str.lower)
+        self.assertEqual(Pattern('<upper:x>/').match('ABC/'), ('ABC/', dict(x='abc')))
+        with self.assertRaises(ValueError):
+            register_converter('bad', r'(a)')
+        with self.assertRaises(ValueError):
+            register_converter('bad-name', r'a')
+
+        # Patterns are validated when the Router is defined
+        with self.assertRaises(ValueError):
+            class R(Router):
+                routes = {
+                    '<unregistered:x>/': lambda sr, x: x,
+                }
+
     def test_multi(self):
         from datetime import date
         p = Pattern('prefix-<str:s>/<int:i>-<date:d>/suffix/')
@@ -249,6 +352,61 @@ class TestPattern(unittest.TestCase):
         self.assertEqual(match, 'prefix-string/-33-2000-01-01/suffix/')
         self.assertEqual(captures, dict(s='string', i=-33, d=date(2000,1,1)))
 
+class TestRouteTable(unittest.TestCase):
+    def test_declaration_order(self):
+        from datetime import date
+        from django_subserver.route_table import RouteTable
+        patterns = [
+            'a/b/',
+            '<date:d>/',
+            '<str:s>/',
+            'a/',
+            '<int:i>/',
+            'c-<int:i>/',
+        ]
+        table = RouteTable([Pattern(p) for p in patterns])
+
+        def linear(path):
+            for index, pattern in enumerate(patterns) :
+                try :
+                    match, captures = Pattern(pattern).match(path)
+                except ValueError :
+                    continue
+                return index, len(match), captures
+            return None
+
+        for path in ['a/b/c', 'a/', 'a/c/', '2000-01-01/', '2000-13-01/', '5/', 'c-5/', 'c', '', 'x/y/'] :
+            self.assertEqual(table.match(path), linear(path), path)
+
+        self.assertEqual(table.match('2000-01-01/'), (1, 11, dict(d=date(2000,1,1))))
+        # converter failure falls through to the next matching pattern
+        self.assertEqual(table.match('2000-13-01/'), (2, 11, dict(s='2000-13-01')))
+        # earlier dynamic pattern beats later fixed pattern
+        self.assertEqual(table.match('a/c/'), (2, 2, dict(s='a')))
+        # matching at an offset
+        self.assertEqual(table.match('/x/a/b/c', 3), (0, 7, dict()))
+
+    def test_multi_segment_order(self):
+        from django_subserver.route_table import RouteTable
+        table = RouteTable([Pattern(p) for p in [
+            '<int:i>/x/',
+            '<str:s>/y/',
+            '<int:i>/y/',
+            '<int:i>/',
+        ]])
+        self.assertEqual(table.match('5/x/'), (0, 4, dict(i=5)))
+        self.assertEqual(table.match('5/y/'), (1, 4, dict(s='5')))
+        self.assertEqual(table.match('5/z/'), (3, 2, dict(i=5)))
+
+    def test_multi_segment_converter(self):
+        from django_subserver.route_table import RouteTable
+        table = RouteTable([Pattern(p) for p in [
+            '<path:p>/<slug:s>/',
+            '<path:p>/',
+        ]])
+        self.assertEqual(table.match('a/b/c/'), (0, 6, dict(p='a/b', s='c')))
+        self.assertEqual(table.match('a/b.c/'), (1, 6, dict(p='a/b.c')))
+
 class TestRouter(unittest.TestCase):
     class EmptyRouter(Router):
         pass
@@ -346,6 +504,136 @@ class TestRouter(unittest.TestCase):
             'Hello, World!',
         )
 
+    def test_compile_tree(self):
+        calls = []
+        def leaf(sr, **kwargs):
+            return sr.parent_path, sr.sub_path, kwargs
+        class Loading(Router):
+            routes = {
+                '<int:y>/': leaf,
+            }
+            def prepare(self, request, **kwargs):
+                calls.append(kwargs)
+        class Inner(Router):
+            routes = {
+                '<date:d>/leaf/': leaf,
+                'loading-<int:x>/': Loading(),
+            }
+            cascade = [lambda sr: 'CASCADE']
+        class Middle(Router):
+            routes = {
+                '<int:ignored>/': Inner(),
+            }
+        class Root(Router):
+            routes = {
+                'a/': Middle(),
+                '<str:s>/': leaf,
+            }
+
+        paths = [
+            '/a/1/2000-01-01/leaf/rest',
+            '/a/1/2000-13-01/leaf/',
+            '/a/1/loading-5/6/',
+            '/b/',
+        ]
+        expected = [Root()(self.sub_request_factory(path)) for path in paths]
+        root = Root().compile_tree()
+        self.assertIs(root.compile_tree(), root)
+        self.assertIn(
+            'a/<int:ignored>/<date:d>/leaf/',
+            [pattern.pattern for pattern, view in root.routes],
+        )
+        self.assertEqual(
+            [root(self.sub_request_factory(path)) for path in paths],
+            expected,
+        )
+        self.assertEqual(expected[0], ('/a/1/2000-01-01/leaf/', 'rest', dict(d=date(2000,1,1))))
+        self.assertEqual(expected[1], 'CASCADE')
+        self.assertEqual(calls[-1], dict(x=5))
+        with self.assertRaises(Http404):
+            root(self.sub_request_factory('/a/x/'))
+
+    def test_route_cache(self):
+        conversions = []
+        def counting_get_date(string):
+            conversions.append(string)
+            return date.fromisoformat(string)
+        register_converter('counting_date', r'\d\d\d\d-\d\d-\d\d', counting_get_date)
+        class R(Router):
+            route_cache_size = 3
+            routes = {
+                '<counting_date:d>/': self.returning_mock_sub_view,
+            }
+        r = R()
+
+        for path in ['/2000-01-01/', '/2000-01-01/a', '/2000-01-02/', '/2000-01-01/'] :
+            sr, kwargs = r(self.sub_request_factory(path))
+        self.assertEqual(kwargs, dict(d=date(2000,1,1)))
+        self.assertEqual(conversions, ['2000-01-01', '2000-01-01', '2000-01-02'])
+        info = r.route_cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 3, 3))
+
+        for i in range(10) :
+            with self.assertRaises(Http404) :
+                r(self.sub_request_factory(f'/{i}/'))
+        self.assertEqual(r.route_cache_info().currsize, 3)
+        self.assertIsNone(self.EmptyRouter().route_cache_info())
+
+    def test_not_found(self):
+        def match_1(sr):
+            if sr.sub_path == '1' :
+                return 1
+            return NOT_FOUND
+        class Inner(Router):
+            return_not_found = True
+            cascade = [match_1]
+        class R(Router):
+            cascade = [
+                Inner(),
+                lambda sr: 2 if sr.sub_path == '2' else NOT_FOUND,
+            ]
+        class Outer(Router):
+            return_not_found = True
+            cascade = [R()]
+
+        self.assertEqual(R()(self.sub_request_factory('/1')), 1)
+        self.assertEqual(R()(self.sub_request_factory('/2')), 2)
+        self.assertIs(Inner()(self.sub_request_factory('/2')), NOT_FOUND)
+        with self.assertRaises(Http404):
+            R()(self.sub_request_factory('/3'))
+        self.assertIs(Outer()(self.sub_request_factory('/3')), NOT_FOUND)
+
+        with self.assertRaises(Http404):
+            sub_view_urls(Inner())[0].callback(RequestFactory().get('/2'), sub_path='2')
+
+    def test_lazy_view_spec(self):
+        class R(Router):
+            routes = {
+                'a/': 'LazilyCreated',
+                'b/': 'LazilyCreated',
+            }
+            cascade = ['LazilyCreated']
+        r = R()
+        r2 = R()
+        self.assertEqual(LazilyCreated.instances, 0)
+        self.assertEqual(r(SubRequest(RequestFactory().get('/a/'))), 'LAZY')
+        self.assertEqual(LazilyCreated.instances, 1)
+        self.assertEqual(r2(SubRequest(RequestFactory().get('/c'))), 'LAZY')
+        r.warm()
+        # Every ViewSpec refers to the same, shared instance
+        views = [view for pattern, view in r.routes] + r.cascade_to
+        self.assertEqual(len(set(map(id, views))), 1)
+        self.assertIsInstance(views[0], LazilyCreated)
+        self.assertEqual(LazilyCreated.instances, 1)
+
+        class Broken(Router):
+            routes = {
+                'a/': 'DoesNotExist',
+            }
+        broken = Broken()
+        with self.assertRaises(AttributeError):
+            broken.warm()
+
     def test_optional_route(self):
         class R(Router):
             routes = {
@@ -365,9 +653,1077 @@ class TestRouter(unittest.TestCase):
             R()(SubRequest(RequestFactory().get('/a')))
 
 
+class TestAsyncRouter(unittest.TestCase):
+    def sub_request_factory(self, path):
+        return SubRequest(RequestFactory().get(path))
+
+    def test_routing(self):
+        async def async_view(sr, **kwargs):
+            return 'async', kwargs
+        def sync_view(sr, **kwargs):
+            return 'sync', kwargs
+        class SyncChild(Router):
+            routes = {
+                'async/': async_view,
+            }
+            root_view = sync_view
+        class R(AsyncRouter):
+            routes = {
+                'a/<int:x>/': async_view,
+                's/<int:x>/': sync_view,
+                'child/': SyncChild(),
+            }
+            cascade = [
+                lambda sr: NOT_FOUND,
+                lambda sr: 'CASCADE' if sr.sub_path == 'c' else NOT_FOUND,
+            ]
+            async def prepare(self, request, **kwargs):
+                request.prepared = True
+
+        r = R().compile_tree()
+        def call(path):
+            return asyncio.run(r(self.sub_request_factory(path)))
+        self.assertEqual(call('/a/1/'), ('async', dict(x=1)))
+        self.assertEqual(call('/s/2/'), ('sync', dict(x=2)))
+        self.assertEqual(call('/child/'), ('sync', dict()))
+        self.assertEqual(call('/child/async/'), ('async', dict()))
+        self.assertEqual(call('/c'), 'CASCADE')
+        with self.assertRaises(Http404):
+            call('/d')
+
+        # Sync Router containing an AsyncRouter
+        class S(Router):
+            routes = {
+                'r/': R(),
+            }
+        self.assertEqual(S()(self.sub_request_factory('/r/a/3/')), ('async', dict(x=3)))
+
+    def test_sub_view_urls(self):
+        from asgiref.sync import iscoroutinefunction
+        class R(AsyncRouter):
+            root_view = lambda sr: 'ROOT'
+        view = sub_view_urls(R())[0].callback
+        self.assertTrue(iscoroutinefunction(view))
+        self.assertEqual(asyncio.run(view(RequestFactory().get('/'), sub_path='')), 'ROOT')
+        self.assertFalse(iscoroutinefunction(sub_view_urls(Router())[0].callback))
+
+class TestRouteMetrics(unittest.TestCase):
+    def test_threads(self):
+        import gc, threading
+        metrics = RouteMetrics()
+        def record():
+            metrics.record('R', None, 0.001)
+        for i in range(50) :
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        gc.collect()
+        self.assertEqual(metrics.snapshot()['R']['total']['count'], 50)
+        # Shards of finished threads are folded into the shared total
+        record()
+        self.assertEqual(len(metrics._shards), 1)
+        self.assertEqual(metrics.snapshot()['R']['total']['count'], 51)
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_router(self):
+        route_metrics = RouteMetrics(buckets=[1, 1000])
+        class Base(Router):
+            metrics = route_metrics
+        class Child(Base):
+            root_view = lambda sr: 'CHILD'
+        class R(Base):
+            root_view = lambda sr: 'ROOT'
+            routes = {
+                'a/<int:x>/': lambda sr, x: 'A',
+                'child/': Child(),
+            }
+            cascade = [
+                lambda sr: NOT_FOUND,
+                lambda sr: 'C' if sr.sub_path == 'c' else NOT_FOUND,
+            ]
+        r = R()
+        for path in ['/', '/a/1/', '/a/2/', '/child/', '/c', '/missing'] :
+            try :
+                r(SubRequest(RequestFactory().get(path)))
+            except Http404 :
+                pass
+
+        snapshot = route_metrics.snapshot()
+        name = f'{R.__module__}.{R.__qualname__}'
+        views = snapshot[name]['views']
+        self.assertEqual(views['a/<int:x>/']['count'], 2)
+        self.assertEqual(views['root_view']['count'], 1)
+        self.assertEqual(views['child/']['count'], 1)
+        self.assertEqual(
+            (views['cascade[0]']['count'], views['cascade[0]']['not_found']),
+            (2, 2),
+        )
+        self.assertEqual(
+            (views['cascade[1]']['count'], views['cascade[1]']['not_found']),
+            (2, 1),
+        )
+        total = snapshot[name]['total']
+        self.assertEqual((total['count'], total['not_found']), (6, 1))
+        self.assertEqual(total['buckets'], [(1, 6), (1000, 6), (float('inf'), 6)])
+        child_name = f'{Child.__module__}.{Child.__qualname__}'
+        self.assertEqual(snapshot[child_name]['views']['root_view']['count'], 1)
+
+        text = route_metrics.prometheus_text()
+        self.assertIn(f'subserver_view_seconds_count{{router="{name}",view="a/<int:x>/"}} 2\n', text)
+        self.assertIn(f'subserver_router_seconds_bucket{{router="{name}",le="+Inf"}} 6\n', text)
+        self.assertIn(f'subserver_view_not_found_total{{router="{name}",view="cascade[0]"}} 2\n', text)
+        self.assertIn(f'subserver_router_not_found_total{{router="{name}"}} 1\n', text)
+
+        route_metrics.reset()
+        self.assertEqual(route_metrics.snapshot(), {})
+
+    def test_async(self):
+        route_metrics = RouteMetrics()
+        class R(AsyncRouter):
+            metrics = route_metrics
+            routes = {
+                'a/': lambda sr: 'A',
+            }
+        r = R()
+        self.assertEqual(asyncio.run(r(SubRequest(RequestFactory().get('/a/')))), 'A')
+        with self.assertRaises(Http404):
+            asyncio.run(r(SubRequest(RequestFactory().get('/b/'))))
+        total = route_metrics.snapshot()[f'{R.__module__}.{R.__qualname__}']['total']
+        self.assertEqual((total['count'], total['not_found']), (2, 1))
+
+class TestTracing(unittest.TestCase):
+    class RecordingTracer(tracing.Tracer):
+        def __init__(self):
+            self.spans = []
+        @contextlib.contextmanager
+        def span(self, name, attributes):
+            self.spans.append((name, attributes))
+            yield
+
+    def tearDown(self):
+        tracing.set_tracer(None)
+
+    def tree(self, base):
+        from django_subserver.module_view import module_view
+        class Child(base):
+            routes = {
+                'hello/': module_view('tests.view_modules.hello_world'),
+            }
+        class R(base):
+            routes = {
+                'c/<int:x>/': Child(),
+            }
+            cascade = [
+                lambda sr: NOT_FOUND,
+            ]
+        return R()
+
+    def test_spans(self):
+        with self.assertRaises(TypeError) :
+            tracing.Tracer()
+        tracer = self.RecordingTracer()
+        tracing.set_tracer(tracer)
+        r = self.tree(Router)
+        self.assertEqual(r(SubRequest(RequestFactory().get('/c/1/hello/'))), 'Hello, World!')
+        self.assertEqual(
+            [name for name, attributes in tracer.spans],
+            ['router', 'prepare', 'dispatch', 'route', 'router', 'prepare', 'dispatch', 'route', 'module_view'],
+        )
+        self.assertEqual(tracer.spans[3][1]['pattern'], 'c/<int:x>/')
+        self.assertEqual(tracer.spans[3][1]['params'], ('x',))
+        self.assertEqual(tracer.spans[4][1]['params'], ('x',))
+        self.assertEqual(tracer.spans[8][1], dict(module='tests.view_modules.hello_world', method='get'))
+
+        tracer.spans = []
+        with self.assertRaises(Http404):
+            asyncio.run(self.tree(AsyncRouter)(SubRequest(RequestFactory().get('/d/'))))
+        self.assertEqual(
+            [name for name, attributes in tracer.spans],
+            ['router', 'prepare', 'dispatch', 'cascade'],
+        )
+
+        tracing.set_tracer(None)
+        tracer.spans = []
+        r(SubRequest(RequestFactory().get('/c/1/hello/')))
+        self.assertEqual(tracer.spans, [])
+
+    def test_server_timing(self):
+        tracing.set_tracer(tracing.ServerTimingTracer())
+        view = sub_view_urls(self.tree(Router))[0].callback
+        def get_response(request):
+            return HttpResponse(view(request, sub_path=request.path[1:]))
+        middleware = tracing.ServerTimingMiddleware(get_response)
+        response = middleware(RequestFactory().get('/c/1/hello/'))
+        header = response['Server-Timing']
+        self.assertIn('route;dur=', header)
+        self.assertIn('module_view;dur=', header)
+        self.assertIn('c/<int:x>/', header)
+
+        # Not recorded outside of the middleware
+        self.assertEqual(view(RequestFactory().get('/c/1/hello/'), sub_path='c/1/hello/'), 'Hello, World!')
+
+class TestExplain(unittest.TestCase):
+    def test_explain(self):
+        class Child(Router):
+            routes = {
+                '<date:d>/': echoing_sub_view,
+            }
+        class Cascaded(Router):
+            return_not_found = True
+            routes = {
+                'cascaded/': echoing_sub_view,
+            }
+        class R(Router):
+            routes = {
+                'a/': echoing_sub_view,
+                'c/<int:x>/': Child(),
+            }
+            cascade = [Cascaded(), echoing_sub_view]
+        r = R()
+
+        explanation = r.explain('/c/1/2000-01-02/')
+        self.assertIs(explanation.view, echoing_sub_view)
+        self.assertEqual(explanation.captures, dict(d=date(2000,1,2)))
+        self.assertTrue(explanation.certain)
+        self.assertEqual(
+            [(step.depth, step.kind, step.detail) for step in explanation.steps if step.kind == 'try'],
+            [(0, 'try', 'a/'), (0, 'try', 'c/<int:x>/'), (1, 'try', '<date:d>/')],
+        )
+        self.assertIn('c/<int:x>/', str(explanation))
+
+        explanation = r.explain('/c/1/2000-13-01/')
+        self.assertIsNone(explanation.view)
+        self.assertIn('converter rejected', explanation.steps[-2].result)
+        self.assertEqual(explanation.steps[-1].kind, 'not_found')
+
+        explanation = r.explain('/cascaded/')
+        self.assertIs(explanation.view, echoing_sub_view)
+        self.assertTrue(explanation.certain)
+
+        explanation = r.explain('/other/')
+        self.assertIs(explanation.view, echoing_sub_view)
+        self.assertFalse(explanation.certain)
+
+        with self.assertRaises(ValueError) :
+            r.explain('a/')
+
+        # Doesn't affect route cache stats
+        class Cached(Router):
+            route_cache_size = 10
+            routes = {
+                'a/': echoing_sub_view,
+            }
+        r = Cached()
+        self.assertIs(r.explain('/a/').view, echoing_sub_view)
+        info = r.route_cache_info()
+        self.assertEqual((info.hits, info.misses), (0, 0))
+
+    def test_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from django_subserver.management.commands.subserver_explain import Command
+
+        out = StringIO()
+        call_command(Command(), '/5/router/a/1/', stdout=out)
+        output = out.getvalue()
+        self.assertIn("{'y': 5}", output)
+        self.assertIn("a/<int:x>/ {'x': 1}", output)
+
+        with self.assertRaises(CommandError):
+            call_command(Command(), '/echoing_sub_view/', stdout=StringIO())
+
+class TestProfiling(unittest.TestCase):
+    def test_sampling(self):
+        from django_subserver.profiling import ProfiledView, profiled
+        def profiled_leaf(sr):
+            return 'LEAF'
+        class R(Router):
+            routes = {
+                'leaf/': profiled_leaf,
+            }
+        view = profiled(R(), sample_rate=0.5, trace_memory=True)
+        self.assertIsInstance(view, ProfiledView)
+        for i in range(4) :
+            self.assertEqual(view(SubRequest(RequestFactory().get('/leaf/'))), 'LEAF')
+        self.assertEqual(view.sampled, 2)
+        report = view.report()
+        self.assertIn('profiled_leaf', report)
+        self.assertIn('Peak memory per request', report)
+
+        with tempfile.TemporaryDirectory() as directory :
+            filename = os.path.join(directory, 'stats')
+            view.dump_stats(filename)
+            self.assertIn('profiled_leaf', str(pstats.Stats(filename).stats))
+
+        view.reset()
+        view.sample_rate = 0
+        view(SubRequest(RequestFactory().get('/leaf/')))
+        self.assertEqual(view.sampled, 0)
+        with self.assertRaises(ValueError):
+            view.sample_rate = 2
+
+    def test_async(self):
+        from django_subserver.profiling import AsyncProfiledView, profiled
+        class R(AsyncRouter):
+            root_view = lambda sr: 'ROOT'
+        view = profiled(R(), sample_rate=1)
+        self.assertIsInstance(view, AsyncProfiledView)
+        # Installable under a Router
+        class Parent(Router):
+            routes = {
+                'profiled/': view,
+            }
+        self.assertEqual(Parent()(SubRequest(RequestFactory().get('/profiled/'))), 'ROOT')
+        self.assertEqual(view.sampled, 1)
+
+    def test_nested(self):
+        import tracemalloc
+        from django_subserver.profiling import profiled
+        inner = profiled(lambda sr: 'INNER', sample_rate=1, trace_memory=True)
+        outer = profiled(lambda sr: inner(sr), sample_rate=1, trace_memory=True)
+        self.assertEqual(outer(SubRequest(RequestFactory().get('/'))), 'INNER')
+        self.assertEqual((outer.sampled, inner.sampled), (1, 0))
+        self.assertFalse(tracemalloc.is_tracing())
+
+        # Another profiler is active
+        with unittest.mock.patch('cProfile.Profile.enable', side_effect=ValueError('Another profiling tool is already active')) :
+            self.assertEqual(outer(SubRequest(RequestFactory().get('/'))), 'INNER')
+        self.assertEqual(outer.sampled, 1)
+        self.assertFalse(tracemalloc.is_tracing())
+
+        # Errors recording the profile don't reach the response
+        with unittest.mock.patch.object(outer, '_record', side_effect=RuntimeError) :
+            self.assertEqual(outer(SubRequest(RequestFactory().get('/'))), 'INNER')
+        self.assertFalse(tracemalloc.is_tracing())
+
+class TestChecks(unittest.TestCase):
+    def ids(self, messages):
+        return [message.id for message in messages]
+
+    def test_shadowed_routes(self):
+        from django_subserver.checks import check_router, shadows
+        self.assertTrue(shadows(Pattern('a/'), Pattern('a/b/')))
+        self.assertTrue(shadows(Pattern('<str:x>/'), Pattern('a/')))
+        self.assertTrue(shadows(Pattern('<int:x>/'), Pattern('5/b/')))
+        self.assertTrue(shadows(Pattern('files/<path:p>/'), Pattern('files/a/<int:x>/')))
+        self.assertTrue(shadows(Pattern('<slug:x>/'), Pattern('<slug:y>/')))
+        self.assertFalse(shadows(Pattern('a/b/'), Pattern('a/')))
+        self.assertFalse(shadows(Pattern('<int:x>/'), Pattern('a/')))
+        self.assertFalse(shadows(Pattern('<date:x>/'), Pattern('2000-13-01/')))
+        self.assertFalse(shadows(Pattern('<int:x>/'), Pattern('<str:x>/')))
+
+        class R(Router):
+            routes = {
+                '<str:x>/': lambda sr, x: 1,
+                'a/': lambda sr: 2,
+            }
+        messages = check_router(R())
+        self.assertEqual(self.ids(messages), ['django_subserver.W001'])
+        self.assertIn('"a/"', messages[0].msg)
+
+    def test_cascade(self):
+        from django_subserver.checks import check_router
+        class Expensive(Router):
+            return_not_found = True
+            def prepare(self, request):
+                pass
+        class Long(Router):
+            cascade = [lambda sr: NOT_FOUND] * 6 + [Expensive()] * 5
+        ids = self.ids(check_router(Long()))
+        self.assertEqual(ids.count('django_subserver.W002'), 1)
+        self.assertEqual(ids.count('django_subserver.W003'), 5)
+
+    def test_backtracking(self):
+        from django_subserver.checks import check_router
+        class R(Router):
+            routes = {
+                '<path:a>/x/<path:b>/': lambda sr, a, b: 1,
+                'a-<str:a><str:b>/': lambda sr, a, b: 1,
+                '<str:a>-<str:b>/': lambda sr, a, b: 1,
+            }
+        self.assertEqual(self.ids(check_router(R())), ['django_subserver.W004'] * 2)
+
+    def test_urlconf(self):
+        from django.core import checks
+        from django_subserver.checks import check_sub_view_urls
+        self.assertIn(check_sub_view_urls, checks.registry.registry.get_checks())
+        messages = checks.run_checks(tags=[checks.Tags.urls])
+        self.assertEqual([message for message in messages if message.id.startswith('django_subserver')], [])
+
+class TestCaching(unittest.TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def tree(self, calls):
+        from django.http import StreamingHttpResponse
+        def page(sr, **kwargs):
+            calls.append(sr.path)
+            return HttpResponse(f'{sr.path} {len(calls)}')
+        def private(sr):
+            calls.append(sr.path)
+            response = HttpResponse('private')
+            response.set_cookie('a', 'b')
+            return response
+        def stream(sr, size):
+            calls.append(sr.path)
+            return StreamingHttpResponse([b'x'] * size)
+        class R(Router):
+            routes = {
+                'private/': private,
+                'stream/<int:size>/': stream,
+                '<str:x>/': page,
+            }
+        return R()
+
+    def get(self, view, path, **extra):
+        return view(SubRequest(RequestFactory().get(path, **extra)))
+
+    def test_cached(self):
+        from django_subserver.caching import cached, invalidate
+        calls = []
+        view = cached(self.tree(calls), query_params=['page'], headers=['Accept-Language'])
+
+        first = self.get(view, '/a/')
+        self.assertEqual(self.get(view, '/a/', data=dict(ignored=1)).content, first.content)
+        self.assertEqual(calls, ['/a/'])
+        self.assertEqual((view.hits, view.misses), (1, 1))
+
+        # Part of the key
+        self.get(view, '/a/', data=dict(page=2))
+        self.get(view, '/a/', HTTP_ACCEPT_LANGUAGE='fr')
+        self.assertEqual(len(calls), 3)
+
+        # Not cached
+        self.get(view, '/private/')
+        self.get(view, '/private/')
+        self.assertEqual(calls.count('/private/'), 2)
+        view(SubRequest(RequestFactory().post('/a/')))
+        self.assertEqual(len(calls), 6)
+
+        # Invalidation by prefix
+        self.get(view, '/b/')
+        invalidate('/a/')
+        self.get(view, '/a/')
+        self.get(view, '/b/')
+        self.assertEqual(calls[-2:], ['/b/', '/a/'])
+
+    def test_middleware(self):
+        from django.test import override_settings
+        from importlib import import_module
+        from django.conf import settings
+        # (This module may be running as __main__, as well as the urlconf)
+        cached_calls = import_module(settings.ROOT_URLCONF).cached_calls
+        with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies') :
+            cached_calls.clear()
+            anonymous = Client()
+            alice = Client()
+
+            # Shared by anonymous requests
+            for client in (anonymous, Client()) :
+                self.assertEqual(client.get('/cached/public/').content, b'public')
+            self.assertEqual(cached_calls, ['/cached/public/'])
+
+            alice.get('/cached/login/', dict(name='alice'))
+            self.assertEqual(alice.get('/cached/me/').content, b'hello alice')
+            # Neither alice's response, nor one that read the session, are shared
+            self.assertEqual(anonymous.get('/cached/me/').content, b'hello anonymous')
+            self.assertEqual(alice.get('/cached/me/').content, b'hello alice')
+            self.assertEqual(anonymous.get('/cached/me/').content, b'hello anonymous')
+            self.assertEqual(cached_calls.count('/cached/me/'), 4)
+
+            # Responses using the CSRF token aren't shared
+            anonymous.get('/cached/form/')
+            Client().get('/cached/form/')
+            self.assertEqual(cached_calls.count('/cached/form/'), 2)
+
+    def test_authenticated(self):
+        from django_subserver.caching import cached
+        calls = []
+        view = cached(self.tree(calls), key_prefix='authenticated')
+        for i in range(2) :
+            request = RequestFactory().get('/a/')
+            request.user = unittest.mock.Mock(is_authenticated=True)
+            view(SubRequest(request))
+        self.get(view, '/a/', HTTP_COOKIE='sessionid=x')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual((view.hits, view.misses), (0, 0))
+
+    def test_hosts(self):
+        from django.test import override_settings
+        from django_subserver.caching import cached
+        calls = []
+        view = cached(self.tree(calls), key_prefix='hosts')
+        with override_settings(ALLOWED_HOSTS=['.example.com']) :
+            self.get(view, '/x/', HTTP_HOST='tenant-a.example.com')
+            b = self.get(view, '/x/', HTTP_HOST='tenant-b.example.com')
+            self.get(view, '/x/', HTTP_HOST='tenant-a.example.com', secure=True)
+            self.assertEqual(len(calls), 3)
+            self.assertEqual(self.get(view, '/x/', HTTP_HOST='tenant-b.example.com').content, b.content)
+        self.assertEqual((view.hits, view.misses), (1, 3))
+
+    def test_template_response(self):
+        from django.template.response import TemplateResponse
+        from django_subserver.caching import cached
+        calls = []
+        def page(sr):
+            calls.append(sr.path)
+            return TemplateResponse(sr.request, 'page.html', dict(n=len(calls)))
+        class R(Router):
+            root_view = page
+        view = cached(R(), key_prefix='template')
+        with template_settings(**{'page.html': 'page {{ n }}'}) :
+            response = self.get(view, '/')
+            self.assertFalse(response.is_rendered)
+            self.assertEqual(response.render().content, b'page 1')
+            self.assertEqual(self.get(view, '/').content, b'page 1')
+        self.assertEqual(calls, ['/'])
+
+    def test_streaming(self):
+        from django_subserver.caching import cached
+        calls = []
+        view = cached(self.tree(calls), max_streaming_size=5)
+        for i in range(2) :
+            self.assertEqual(self.get(view, '/stream/3/').content, b'xxx')
+            self.assertEqual(b''.join(self.get(view, '/stream/10/').streaming_content), b'x' * 10)
+        self.assertEqual(calls, ['/stream/3/', '/stream/10/', '/stream/10/'])
+
+        calls = []
+        view = cached(self.tree(calls), key_prefix='unbuffered')
+        self.get(view, '/stream/3/')
+        self.get(view, '/stream/3/')
+        self.assertEqual(len(calls), 2)
+
+    def test_async(self):
+        from django_subserver.caching import AsyncCachedView, cached
+        calls = []
+        async def page(sr):
+            calls.append(sr.path)
+            return HttpResponse('async')
+        class R(AsyncRouter):
+            root_view = page
+        view = cached(R())
+        self.assertIsInstance(view, AsyncCachedView)
+        for i in range(2) :
+            response = asyncio.run(view(SubRequest(RequestFactory().get('/'))))
+            self.assertEqual(response.content, b'async')
+        self.assertEqual(calls, ['/'])
+
+class TestCoalescing(unittest.TestCase):
+    def test_threads(self):
+        import threading, time
+        from django.test import override_settings
+        from django_subserver.coalescing import CoalescedView, coalesced
+        release = threading.Event()
+        calls = []
+        def slow(sr):
+            calls.append(sr.path)
+            release.wait(5)
+            return HttpResponse(sr.path)
+        view = coalesced(slow)
+        self.assertIsInstance(view, CoalescedView)
+
+        responses = []
+        def request(path):
+            responses.append(view(SubRequest(RequestFactory().get(path))))
+        def other_host():
+            responses.append(view(SubRequest(RequestFactory().get('/a/', HTTP_HOST='other.example.com'))))
+        threads = [threading.Thread(target=request, args=[path]) for path in ['/a/'] * 4 + ['/b/']]
+        threads.append(threading.Thread(target=other_host))
+        with override_settings(ALLOWED_HOSTS=['testserver', 'other.example.com']) :
+            for thread in threads :
+                thread.start()
+            time.sleep(0.2)
+            release.set()
+            for thread in threads :
+                thread.join()
+
+        self.assertEqual(sorted(calls), ['/a/', '/a/', '/b/'])
+        self.assertEqual((view.executed, view.coalesced), (3, 3))
+        self.assertEqual(sorted(response.content for response in responses), [b'/a/'] * 5 + [b'/b/'])
+        self.assertEqual(len(set(map(id, responses))), 6)
+
+        # Not coalesced
+        view(SubRequest(RequestFactory().post('/a/')))
+        self.assertEqual(len(calls), 4)
+
+    def test_uncontended(self):
+        from django_subserver import coalescing
+        async def ok(sr):
+            return HttpResponse('x')
+        view = coalescing.coalesced(lambda sr: HttpResponse('x'))
+        async_view = coalescing.coalesced(ok)
+        with unittest.mock.patch.object(coalescing, '_share', wraps=coalescing._share) as share :
+            self.assertEqual(view(SubRequest(RequestFactory().get('/'))).content, b'x')
+            self.assertEqual(asyncio.run(async_view(SubRequest(RequestFactory().get('/')))).content, b'x')
+        # Nobody was waiting, so the responses weren't pickled
+        share.assert_not_called()
+        self.assertEqual((view.executed, async_view.executed), (1, 1))
+
+    def test_async(self):
+        from django_subserver.coalescing import AsyncCoalescedView, coalesced
+        calls = []
+        async def slow(sr):
+            calls.append(sr.path)
+            await asyncio.sleep(0.01)
+            if sr.path == '/missing/' :
+                raise Http404()
+            return HttpResponse(sr.path)
+        view = coalesced(slow)
+        self.assertIsInstance(view, AsyncCoalescedView)
+
+        async def main():
+            return await asyncio.gather(*(
+                view(SubRequest(RequestFactory().get(path)))
+                for path in ['/a/'] * 3 + ['/missing/'] * 2
+            ), return_exceptions=True)
+        results = asyncio.run(main())
+        self.assertEqual([result.content for result in results[:3]], [b'/a/'] * 3)
+        self.assertIsInstance(results[3], Http404)
+        self.assertIsInstance(results[4], Http404)
+        self.assertEqual(calls, ['/a/', '/missing/'])
+        self.assertEqual((view.executed, view.coalesced), (2, 3))
+
+class TestCallInternal(unittest.TestCase):
+    def test_call_internal(self):
+        calls = []
+        def fragment(sr, **kwargs):
+            calls.append(sr.path)
+            return JsonResponse(dict(
+                path=sr.path,
+                parent_path=sr.parent_path,
+                sub_path=sr.sub_path,
+                method=sr.method,
+                query=sr.GET.dict(),
+                user=sr.user,
+                body=sr.body.decode(),
+                prepared=sr.prepared,
+                custom=hasattr(sr, 'custom'),
+                kwargs=kwargs,
+            ))
+        class Fragments(Router):
+            routes = {
+                'item/<int:id>/': fragment,
+            }
+        class Root(Router):
+            routes = {
+                'fragments/': Fragments(),
+            }
+            def prepare(self, request):
+                request.prepared = True
+
+        parent = RequestFactory().post('/page/', dict(a='1'), HTTP_ACCEPT='text/html')
+        parent.user = 'alice'
+        parent_sub_request = SubRequest(parent)
+        parent_sub_request.custom = 1
+
+        response = Root().call_internal(parent_sub_request, 'fragments/item/3/?q=x')
+        self.assertEqual(json.loads(response.content), dict(
+            path='/fragments/item/3/',
+            parent_path='/fragments/item/3/',
+            sub_path='',
+            method='GET',
+            query=dict(q='x'),
+            user='alice',
+            body='',
+            prepared=True,
+            custom=False,
+            kwargs=dict(id=3),
+        ))
+        # Parent request is untouched
+        self.assertEqual((parent.path, parent.method, parent.POST['a']), ('/page/', 'POST', '1'))
+
+        response = Root().call_internal(parent, 'fragments/item/4/', mount_path='/app/')
+        self.assertEqual(json.loads(response.content)['path'], '/app/fragments/item/4/')
+
+        with self.assertRaises(Http404) :
+            Root().call_internal(parent, 'fragments/nothing/')
+        with self.assertRaises(ValueError) :
+            Root().call_internal(parent, '/fragments/item/3/')
+
+    def test_script_name(self):
+        def fragment(sr):
+            return JsonResponse(dict(
+                path=sr.path,
+                path_info=sr.path_info,
+                meta_path_info=sr.META['PATH_INFO'],
+                content_type=sr.content_type,
+                content_params=sr.content_params,
+            ))
+        class Root(Router):
+            routes = {
+                'fragment/': fragment,
+            }
+        parent = RequestFactory().post('/page/', json.dumps({}), content_type='application/json; charset=utf-8', SCRIPT_NAME='/app')
+        self.assertEqual((parent.path, parent.path_info), ('/app/page/', '/page/'))
+        response = Root().call_internal(parent, 'fragment/', mount_path='/app/')
+        self.assertEqual(json.loads(response.content), dict(
+            path='/app/fragment/',
+            path_info='/fragment/',
+            meta_path_info='/fragment/',
+            content_type='',
+            content_params={},
+        ))
+
+    def test_fragment_cache(self):
+        calls = []
+        def fragment(sr):
+            calls.append(sr.method)
+            return HttpResponse('fragment')
+        class Root(Router):
+            routes = {
+                'fragment/': fragment,
+            }
+        router = Root()
+        cache = {}
+        parent = RequestFactory().get('/page/')
+        for i in range(3) :
+            self.assertEqual(router.call_internal(parent, 'fragment/', fragment_cache=cache).content, b'fragment')
+        router.call_internal(parent, 'fragment/?v=2', fragment_cache=cache)
+        router.call_internal(parent, 'fragment/', method='POST', fragment_cache=cache)
+        router.call_internal(parent, 'fragment/', method='POST', fragment_cache=cache)
+        self.assertEqual(calls, ['GET', 'GET', 'POST', 'POST'])
+
+    def test_template_response(self):
+        from django.template.response import TemplateResponse
+        calls = []
+        def fragment(sr):
+            calls.append(sr.path)
+            return TemplateResponse(sr.request, 'fragment.html', dict(path=sr.path))
+        class Root(Router):
+            routes = {
+                'fragment/': fragment,
+            }
+        class AsyncRoot(AsyncRouter):
+            routes = {
+                'fragment/': fragment,
+            }
+        cache = {}
+        parent = RequestFactory().get('/page/')
+        with template_settings(**{'fragment.html': 'at {{ path }}'}) :
+            for i in range(2) :
+                response = Root().call_internal(parent, 'fragment/', fragment_cache=cache)
+                self.assertEqual(response.content, b'at /fragment/')
+            self.assertEqual(calls, ['/fragment/'])
+            response = asyncio.run(AsyncRoot().call_internal(parent, 'fragment/'))
+            self.assertEqual(response.content, b'at /fragment/')
+
+    def test_async(self):
+        async def fragment(sr, id):
+            return HttpResponse(f'{sr.path} {id}')
+        class Root(AsyncRouter):
+            routes = {
+                '<int:id>/': fragment,
+            }
+        router = Root()
+        parent = RequestFactory().get('/page/')
+        response = asyncio.run(router.call_internal(parent, '5/'))
+        self.assertEqual(response.content, b'/5/ 5')
+        with self.assertRaises(Http404) :
+            asyncio.run(router.call_internal(parent, 'x/'))
+
+class TestBatch(unittest.TestCase):
+    def post(self, view, items):
+        request = RequestFactory().post('/batch/', json.dumps(items), content_type='application/json')
+        request.user = 'alice'
+        return view(SubRequest(request))
+
+    def test_batch(self):
+        import threading
+        from django_subserver.batch import BatchView, batch_view
+        barrier = threading.Barrier(2, timeout=5)
+        def user(sr, id):
+            barrier.wait()
+            return JsonResponse(dict(id=id, user=sr.user, query=sr.GET.dict()))
+        def text(sr):
+            return HttpResponse('text')
+        class Api(Router):
+            routes = {
+                'users/<int:id>/': user,
+                'text/': text,
+            }
+        view = batch_view(Api(), mount_path='/api/', max_workers=2)
+        self.assertIsInstance(view, BatchView)
+
+        # Both user requests must run at once, to pass the barrier
+        response = self.post(view, [
+            dict(path='users/1/?x=y'),
+            dict(path='/api/users/2/'),
+            dict(path='text/', method='HEAD'),
+            dict(path='/api/missing/'),
+            dict(path='/elsewhere/'),
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)
+        self.assertEqual([result['status'] for result in results], [200, 200, 200, 404, 404])
+        self.assertEqual(results[0]['body'], dict(id=1, user='alice', query=dict(x='y')))
+        self.assertEqual(results[1]['body']['id'], 2)
+        self.assertEqual(results[2]['body'], '')
+        self.assertEqual(results[2]['headers']['Content-Type'], 'text/html; charset=utf-8')
+
+        # Serial
+        view = batch_view(Api(), max_workers=1)
+        results = json.loads(self.post(view, [dict(path='text/')]).content)
+        self.assertEqual(results[0]['body'], 'text')
+
+        # Invalid batches
+        self.assertEqual(self.post(view, dict(path='text/')).status_code, 400)
+        self.assertEqual(self.post(view, [dict(path='text/', method='POST')]).status_code, 400)
+        self.assertEqual(self.post(view, [dict(path='text/')] * 21).status_code, 400)
+        self.assertEqual(view(SubRequest(RequestFactory().get('/batch/'))).status_code, 405)
+
+    def test_item_responses(self):
+        from django.template.response import TemplateResponse
+        from django_subserver.batch import batch_view
+        def page(sr):
+            return TemplateResponse(sr.request, 'page.html', dict(path=sr.path))
+        def bad_json(sr):
+            return HttpResponse('{nope', content_type='application/json')
+        class Api(Router):
+            routes = {
+                'page/': page,
+                'bad-json/': bad_json,
+            }
+        request = RequestFactory().post('/1/batch/', json.dumps([dict(path='page/'), dict(path='bad-json/')]), content_type='application/json')
+        with template_settings(**{'page.html': 'at {{ path }}'}) :
+            # Mounted below a capturing prefix (ie. '<int:x>/batch/')
+            response = batch_view(Api(), max_workers=1)(SubRequest(request), x=1)
+        results = json.loads(response.content)
+        self.assertEqual([result['status'] for result in results], [200, 200])
+        self.assertEqual([result['body'] for result in results], ['at /page/', '{nope'])
+
+    def test_async(self):
+        from django_subserver.batch import AsyncBatchView, batch_view
+        running = []
+        async def item(sr, id):
+            running.append(id)
+            await asyncio.sleep(0.01)
+            return JsonResponse(dict(id=id, concurrent=len(running)))
+        class Api(AsyncRouter):
+            routes = {
+                '<int:id>/': item,
+            }
+        view = batch_view(Api())
+        self.assertIsInstance(view, AsyncBatchView)
+        response = asyncio.run(self.post(view, [dict(path=f'{id}/') for id in range(3)] + [dict(path='x/')]))
+        results = json.loads(response.content)
+        self.assertEqual([result['status'] for result in results], [200, 200, 200, 404])
+        self.assertEqual([result['body']['id'] for result in results[:3]], [0, 1, 2])
+        self.assertEqual([result['body']['concurrent'] for result in results[:3]], [3, 3, 3])
+
+class TestLoading(unittest.TestCase):
+    def test_loader(self):
+        calls = []
+        def load_projects(ids):
+            calls.append(sorted(ids))
+            return {id: f'project {id}' for id in ids if id < 100}
+        def show(sr):
+            return HttpResponse(f'{sr.project} {sr.others}')
+        class ProjectRouter(Router):
+            loaders = {
+                'project': load_projects,
+            }
+            root_view = show
+            def prepare(self, request, id):
+                loader = self.loader(request, 'project')
+                # Sibling lookups, batched into one call
+                others = loader.defer(id + 1), loader.defer(id + 2)
+                request.project = loader.load(id)
+                request.others = [other.get() for other in others]
+        class Root(Router):
+            routes = {
+                '<int:id>/': ProjectRouter(),
+            }
+            def dispatch(self, request, view):
+                # A fragment, derived from this request, shares its loaders
+                if request.sub_path == '1/' :
+                    self.call_internal(request, '2/')
+                return view(request)
+        router = Root()
+
+        response = router(SubRequest(RequestFactory().get('/1/')))
+        self.assertEqual(response.content, b"project 1 ['project 2', 'project 3']")
+        # The fragment (handled first) loaded 2, 3 and 4, so only 1 was left
+        self.assertEqual(calls, [[2, 3, 4], [1]])
+
+        with self.assertRaises(Http404) :
+            router(SubRequest(RequestFactory().get('/99/')))
+
+    def test_loader_methods(self):
+        from django_subserver.loading import Loader
+        calls = []
+        def load(keys):
+            calls.append(keys)
+            return [key * 2 if key else None for key in keys]
+        loader = Loader(load)
+        self.assertEqual(loader.load_many([1, 2, 1]), [2, 4, 2])
+        loader.prime(3, 'primed')
+        self.assertEqual(loader.load(3), 'primed')
+        loader.clear(1)
+        self.assertEqual(loader.load(1), 2)
+        with self.assertRaises(Http404) :
+            loader.load(0)
+        self.assertEqual(calls, [[1, 2], [1], [0]])
+        self.assertEqual(loader.calls, 3)
+
+    def test_async(self):
+        calls = []
+        async def load_items(ids):
+            calls.append(sorted(ids))
+            return {id: f'item {id}' for id in ids if id}
+        async def show(sr):
+            return HttpResponse(sr.item)
+        class ItemRouter(AsyncRouter):
+            loaders = {
+                'item': load_items,
+            }
+            root_view = show
+            async def prepare(self, request, id):
+                request.item = await self.loader(request, 'item').load(id)
+        class Root(AsyncRouter):
+            routes = {
+                '<int:id>/': ItemRouter(),
+            }
+        router = Root()
+
+        async def main():
+            parent = RequestFactory().get('/')
+            # Concurrent fragments of one request - loaded in one call
+            return await asyncio.gather(*(
+                router.call_internal(parent, path)
+                for path in ['1/', '2/', '1/', '0/']
+            ), return_exceptions=True)
+        results = asyncio.run(main())
+        self.assertEqual([result.content for result in results[:3]], [b'item 1', b'item 2', b'item 1'])
+        self.assertIsInstance(results[3], Http404)
+        self.assertEqual(calls, [[0, 1, 2]])
+
+class TestBulkhead(unittest.TestCase):
+    def test_threads(self):
+        import threading, time
+        from django_subserver import bulkhead as bulkhead_module
+        from django_subserver.bulkhead import BulkheadView, bulkhead
+        release = threading.Event()
+        def slow(sr):
+            release.wait(5)
+            return HttpResponse('done')
+        view = bulkhead(slow, limit=1, queue_size=1, queue_timeout=5, retry_after=7, name='slow')
+        self.assertIsInstance(view, BulkheadView)
+
+        responses = []
+        def request():
+            responses.append(view(SubRequest(RequestFactory().get('/'))))
+        threads = [threading.Thread(target=request) for i in range(2)]
+        for thread in threads :
+            thread.start()
+            time.sleep(0.1)
+        self.assertEqual(bulkhead_module.status()['slow'], dict(limit=1, in_flight=1, queue_size=1, waiting=1, admitted=1, shed=0))
+
+        # Saturated - shed immediately
+        response = view(SubRequest(RequestFactory().get('/')))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+
+        release.set()
+        for thread in threads :
+            thread.join()
+        self.assertEqual([response.content for response in responses], [b'done', b'done'])
+        self.assertEqual(view.status(), dict(limit=1, in_flight=0, queue_size=1, waiting=0, admitted=2, shed=1))
+
+        # Queue timeout
+        release.clear()
+        view = bulkhead(slow, limit=1, queue_size=1, queue_timeout=0.01)
+        thread = threading.Thread(target=request)
+        thread.start()
+        time.sleep(0.1)
+        self.assertEqual(view(SubRequest(RequestFactory().get('/'))).status_code, 503)
+        release.set()
+        thread.join()
+
+    def test_streaming(self):
+        from django.http import StreamingHttpResponse
+        from django_subserver.bulkhead import bulkhead
+        view = bulkhead(lambda sr: StreamingHttpResponse(iter([b'a', b'b'])), limit=1)
+        response = view(SubRequest(RequestFactory().get('/')))
+        # Slot held until the response is closed
+        self.assertEqual(view.in_flight, 1)
+        self.assertEqual(view(SubRequest(RequestFactory().get('/'))).status_code, 503)
+        self.assertEqual(b''.join(response), b'ab')
+        response.close()
+        self.assertEqual(view.in_flight, 0)
+
+    def test_async(self):
+        from django_subserver.bulkhead import AsyncBulkheadView, bulkhead
+        order = []
+        async def slow(sr):
+            order.append(sr.path)
+            await asyncio.sleep(0.01)
+            return HttpResponse(sr.path)
+        view = bulkhead(slow, limit=1, queue_size=2, queue_timeout=5)
+        self.assertIsInstance(view, AsyncBulkheadView)
+
+        async def main():
+            return await asyncio.gather(*(
+                view(SubRequest(RequestFactory().get(f'/{i}/')))
+                for i in range(4)
+            ))
+        responses = asyncio.run(main())
+        self.assertEqual([response.status_code for response in responses], [200, 200, 200, 503])
+        self.assertEqual(order, ['/0/', '/1/', '/2/'])
+        self.assertEqual(view.status(), dict(limit=1, in_flight=0, queue_size=2, waiting=0, admitted=3, shed=1))
+
+        # Queue timeout
+        view.queue_timeout = 0.001
+        responses = asyncio.run(main())
+        self.assertEqual([response.status_code for response in responses], [200, 503, 503, 503])
+        self.assertEqual(view.in_flight, 0)
+
+    def test_loops(self):
+        import threading, time
+        from django_subserver.bulkhead import bulkhead
+        started = threading.Event()
+        release = threading.Event()
+        async def slow(sr):
+            started.set()
+            await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+            return HttpResponse(sr.path)
+        view = bulkhead(slow, limit=1, queue_size=1, queue_timeout=5)
+        def request(path):
+            return asyncio.run(view(SubRequest(RequestFactory().get(path))))
+
+        # Each thread runs its own event loop
+        statuses = {}
+        def run(path):
+            statuses[path] = request(path).status_code
+        first = threading.Thread(target=run, args=['/a/'])
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=run, args=['/b/'])
+        second.start()
+        for i in range(100) :
+            if view.waiting :
+                break
+            time.sleep(0.01)
+        self.assertEqual(view.status()['waiting'], 1)
+        self.assertEqual(request('/c/').status_code, 503)
+
+        release.set()
+        first.join()
+        second.join()
+        self.assertEqual(statuses, {'/a/': 200, '/b/': 200})
+        self.assertEqual(view.status(), dict(limit=1, in_flight=0, queue_size=1, waiting=0, admitted=2, shed=1))
+
 class ReturnA(SubView):
     def __call__(self, *args, **kwargs):
         return 'A'
+class LazilyCreated(SubView):
+    instances = 0
+    def __init__(self):
+        LazilyCreated.instances += 1
+    def __call__(self, *args, **kwargs):
+        return 'LAZY'
 
 class TestModuleView(unittest.TestCase):
     def test(self):
@@ -388,11 +1744,99 @@ class TestModuleView(unittest.TestCase):
             view(rf.post('/')).status_code,
             405,
         )
-        # Options
         self.assertEqual(
-            view(rf.options('/')).get('allow'),
-            'GET, OPTIONS',
+            view(rf.post('/')).get('allow'),
+            'GET, HEAD, OPTIONS',
         )
+        # Options
+        for i in range(2) :
+            self.assertEqual(
+                view(rf.options('/')).get('allow'),
+                'GET, HEAD, OPTIONS',
+            )
+
+    def test_head(self):
+        from django_subserver.module_view import module_view
+        view = module_view('tests.view_modules.responses')
+        rf = RequestFactory()
+        response = view(rf.head('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Length'], '5')
+        self.assertEqual(response['X-Handled-By'], 'get')
+        self.assertEqual(view(rf.get('/')).content, b'Hello')
+
+        view = module_view('tests.view_modules.async_hello_world')
+        self.assertEqual(asyncio.run(view(rf.head('/'))), 'Hello, World!')
+
+    def test_conditional(self):
+        from django_subserver.module_view import module_view
+        from tests.view_modules import conditional
+        view = module_view('tests.view_modules.conditional')
+        rf = RequestFactory()
+
+        response = view(rf.get('/'))
+        self.assertEqual(response.content, b'expensive')
+        self.assertEqual(response['ETag'], '"v1"')
+        self.assertEqual(response['Last-Modified'], 'Sat, 01 Jan 2000 00:00:00 GMT')
+        self.assertEqual(conditional.calls, ['get'])
+
+        for response in (view(rf.get('/', HTTP_IF_NONE_MATCH='"v1"')), view(rf.head('/', HTTP_IF_NONE_MATCH='"v1"'))) :
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], '"v1"')
+            self.assertEqual(response['Last-Modified'], 'Sat, 01 Jan 2000 00:00:00 GMT')
+            self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(view(rf.get('/', HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2000 00:00:00 GMT')).status_code, 304)
+        self.assertEqual(conditional.calls, ['get'])
+
+        self.assertEqual(view(rf.get('/', HTTP_IF_NONE_MATCH='"v0"')).status_code, 200)
+        self.assertEqual(conditional.calls, ['get', 'get'])
+
+    def test_auth(self):
+        from django_subserver.module_view import module_view
+        from tests.view_modules import authed
+        view = module_view('tests.view_modules.authed')
+        rf = RequestFactory()
+
+        self.assertEqual(view(rf.get('/')).status_code, 403)
+        self.assertEqual(view(rf.get('/', dict(allowed=1))), 'SECRET')
+        # Default OPTIONS response doesn't require auth
+        self.assertEqual(view(rf.options('/')).status_code, 200)
+
+        # Memoized for the rest of the request, at every routing level
+        authed.auth_checks.clear()
+        request = SubRequest(rf.get('/a/', dict(allowed=1)))
+        self.assertEqual(view(request), 'SECRET')
+        self.assertEqual(view(request.after('a/')), 'SECRET')
+        self.assertEqual(authed.auth_checks, ['/a/'])
+
+        async def async_auth(request):
+            return 'DENIED'
+        with unittest.mock.patch('tests.view_modules.hello_world.handle_auth', async_auth, create=True) :
+            async_view = module_view('tests.view_modules.hello_world')
+        self.assertEqual(asyncio.run(async_view(rf.get('/'))), 'DENIED')
+
+    def test_memoize_bare(self):
+        from django_subserver.module_view import memoize_per_request
+        calls = []
+        @memoize_per_request
+        def check(request):
+            calls.append(request.path)
+            return 'checked'
+        request = RequestFactory().get('/')
+        self.assertEqual((check(request), check(request)), ('checked', 'checked'))
+        self.assertEqual(calls, ['/'])
+
+    def test_async(self):
+        from asgiref.sync import iscoroutinefunction
+        from django_subserver.module_view import module_view
+        view = module_view('tests.view_modules.async_hello_world')
+        self.assertTrue(iscoroutinefunction(view))
+
+        rf = RequestFactory()
+        self.assertEqual(asyncio.run(view(rf.get('/'))), 'Hello, World!')
+        self.assertEqual(asyncio.run(view(rf.post('/'))), 'Hello, POST!')
+        self.assertEqual(asyncio.run(view(rf.put('/'))).status_code, 405)
 
 if __name__ == '__main__':
     unittest.main()
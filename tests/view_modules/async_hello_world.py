@@ -0,0 +1,4 @@
+async def handle_get(request):
+    return 'Hello, World!'
+def handle_post(request):
+    return 'Hello, POST!'
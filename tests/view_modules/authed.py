@@ -0,0 +1,13 @@
+from django.http import HttpResponseForbidden
+from django_subserver.module_view import memoize_per_request
+
+auth_checks = []
+
+@memoize_per_request('allowed')
+def handle_auth(request):
+    auth_checks.append(request.path)
+    if not request.GET.get('allowed') :
+        return HttpResponseForbidden()
+
+def handle_get(request):
+    return 'SECRET'
@@ -0,0 +1,12 @@
+from datetime import datetime
+from django.http import HttpResponse
+
+calls = []
+
+def handle_etag(request):
+    return 'v1'
+def handle_last_modified(request):
+    return datetime(2000, 1, 1)
+def handle_get(request):
+    calls.append('get')
+    return HttpResponse('expensive')
@@ -0,0 +1,6 @@
+from django.http import HttpResponse
+
+def handle_get(request):
+    response = HttpResponse('Hello')
+    response['X-Handled-By'] = 'get'
+    return response